@@ -0,0 +1,369 @@
+# Portions Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+# Offline benchmark of the dataset pipeline. Synthetic sources are generated with ffmpeg's
+# testsrc/mandelbrot at the sizes, frame rates and lengths of the real ones, and the
+# download layers of the datasets are stubbed to copy them, so nothing touches the network.
+# It times the clip extraction on its own, every ClipEncoder setting against the imageio
+# writer (writing a clip and reading it back) and the build of every dataset end to end.
+# It reports frames/s, MB/s and peak memory per stage, and checks that the seeked
+# extraction returns exactly the frames of a full decode from t=0.
+#
+#   python dataset/benchmark.py --work_dir /tmp/videoedit_bench --save_baseline before.json
+#   python dataset/benchmark.py --work_dir /tmp/videoedit_bench --baseline before.json
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from functools import partial
+from pathlib import Path
+
+import ffmpeg
+import imageio
+import numpy as np
+import pandas as pd
+
+from moca_data import dreamix, loveu, youtube_8m
+from moca_data.cli import add_build_arguments
+from moca_data import (
+    ENCODERS, MOTION, OBJECT, ClipEncoder, collect_stages, motion_stats, output_dirs, read_clip, read_clips, read_frames,
+    timed_stage, write_json_atomic,
+)
+
+
+# name: (lavfi source, width, height, fps, seconds)
+SOURCES = {
+    # YouTube-8M: 16:9 and 4:3 uploads of a few minutes, with clips up to ~5 minutes in
+    'yt_720p': ('testsrc', 1280, 720, '30000/1001', 150),
+    'yt_1080p': ('testsrc', 1920, 1080, 30, 60),
+    'yt_480p_4x3': ('mandelbrot', 640, 480, 25, 40),
+    'yt_720p_long': ('testsrc', 1280, 720, 30, 345),
+    # Dreamix: short demo clips
+    'dreamix_720p': ('testsrc', 1280, 720, 24, 8),
+    'dreamix_1080p': ('mandelbrot', 1920, 1080, 30, 5),
+    # LOVEU-TGVE: 480p clips of a few seconds
+    'loveu_davis': ('testsrc', 854, 480, 24, 3),
+    'loveu_videvo': ('mandelbrot', 854, 480, 30, 8),
+}
+
+# synthetic work lists in the format of each dataset's data, with the clip layouts of the real ones
+YOUTUBE_DATA = [
+    ('yt_720p', [67, 138], [0.3, 0.2], ["clip"] * 2, [["edit"] * 5, ["edit"] * 2], [[MOTION] * 5, [MOTION] * 2]),
+    ('yt_1080p', [6, 22, 50], [0.2, 0.25, 0.3], ["clip"] * 3, [["edit"] * 4, ["edit"] * 3, ["edit"]], [[OBJECT] * 4, [OBJECT] * 3, [OBJECT]]),
+    ('yt_480p_4x3', [3, 26], [0.2, 0.2], ["clip"] * 2, [["edit"], ["edit"]], [[MOTION], [MOTION]]),
+    # far apart clips get a seek each
+    ('yt_720p_long', [270, 335], [0.2, 0.3], ["clip"] * 2, [["edit"] * 3, ["edit"] * 4], [[MOTION] * 3, [MOTION] * 4]),
+]
+DREAMIX_DATA = [
+    ('bench://dreamix_720p.mp4', 1, 0.3, 2, "clip", ["edit"] * 2, [OBJECT] * 2),
+    ('bench://dreamix_1080p.mp4', 0, 0.0, 0, "clip", ["edit"] * 3, [MOTION] * 3),
+]
+# (LOVEU video name, section, source)
+LOVEU_VIDEOS = [('gold-fish', 'DAVIS Videos:', 'loveu_davis'), ('raindrops', 'Videvo Videos:', 'loveu_videvo')]
+
+DATASETS = ['youtube_8m', 'dreamix', 'loveu']
+
+# ClipEncoder settings compared with the imageio writer
+ENCODER_CONFIGS = {
+    'imageio': dict(kind='imageio'),
+    'ffmpeg': dict(kind='ffmpeg'),
+    'ffmpeg_veryfast': dict(kind='ffmpeg', preset='veryfast'),
+    'ffmpeg_intra': dict(kind='ffmpeg', gop=1),
+    'lossless': dict(kind='lossless'),
+    'raw': dict(kind='raw'),
+}
+
+MB = 1 << 20
+
+
+def make_source(fname, source, width, height, fps, seconds):
+    # x264 defaults (250 frame GOPs with B-frames) so seeking costs what it does on real uploads
+    tmp_fname = fname.with_name(f'{fname.stem}.part{fname.suffix}')
+    (
+        ffmpeg.input(f'{source}=size={width}x{height}:rate={fps}', format='lavfi', t=seconds)
+        .output(str(tmp_fname), vcodec='libx264', preset='veryfast', pix_fmt='yuv420p')
+        .overwrite_output().run(quiet=True)
+    )
+    os.replace(tmp_fname, fname)
+
+
+def make_sources(source_dir):
+    # sources are generated once and reused by later runs
+    source_dir.mkdir(parents=True, exist_ok=True)
+    fnames = {}
+    for name, spec in SOURCES.items():
+        fnames[name] = source_dir / f'{name}.mp4'
+        if not fnames[name].exists():
+            print(f'generating {name} {spec}')
+            make_source(fnames[name], *spec)
+    return fnames
+
+
+def make_loveu_folder(loveu_folder, sources):
+    # a LOVEU-TGVE folder with a CSV in the dataset's layout, whose videos are the synthetic sources
+    rows = []
+    for name, section, source in LOVEU_VIDEOS:
+        if rows:
+            # sections are separated by an empty row
+            rows.append({'Video name': None})
+        rows.append({'Video name': section})
+        rows.append(dict({'Video name': name, 'Our GT caption': "clip"}, **{key: "edit" for key in loveu.EDIT_KEYS}))
+        fname = loveu_folder / loveu.SECTIONS[section] / '480p_videos' / f'{name}.mp4'
+        fname.parent.mkdir(parents=True, exist_ok=True)
+        if not fname.exists():
+            os.symlink(sources[source], fname)
+    pd.DataFrame(rows, columns=['Video name', 'Our GT caption', *loveu.EDIT_KEYS]).to_csv(loveu_folder / loveu.CSV_NAME, index=False)
+
+
+def copy_download(fnames, name, save_fname):
+    # stands in for yt-dlp and the Dreamix site, timed like a real download
+    with timed_stage('download') as counters:
+        shutil.copyfile(fnames[name], save_fname)
+        counters['bytes_out'] = os.path.getsize(save_fname)
+
+
+def reference_clips(input_file, clips, fps, resolution, T=2):
+    # The pre-seek extraction: the source is decoded and resampled from t=0 and each clip
+    # is sliced out of the frame stream afterwards. read_clips has to return exactly these.
+    videos = []
+    for offset_W, offset_T in clips:
+        crop = (resolution, resolution) if offset_W is None else (resolution, resolution, f"{offset_W}*iw", 0)
+        process = (
+            ffmpeg.input(str(input_file))
+            .filter('fps', fps=fps, round='up')
+            .filter('scale', w=resolution, h=resolution, force_original_aspect_ratio='increase')
+            .filter('crop', *crop)
+            .output('pipe:', format='rawvideo', pix_fmt='rgb24')
+            .run_async(pipe_stdout=True, pipe_stderr=True)
+        )
+        videos.append(read_frames(process, T*fps, (resolution, resolution, 3), skip=int(offset_T * fps)))
+    return videos
+
+
+def check_frames(sources):
+    # compares read_clips with reference_clips on the YouTube-8M and LOVEU clip layouts
+    cases = [(name, list(zip(offsets_W, starts))) for name, starts, offsets_W, *_ in YOUTUBE_DATA]
+    cases += [(source, [(None, 0)]) for _, _, source in LOVEU_VIDEOS]
+    failures = []
+    for name, clips in cases:
+        variants = [(resolution, fps) for resolution in args.resolution for fps in args.fps]
+        videos_all = read_clips(sources[name], clips, variants)
+        for (resolution, fps), videos in videos_all.items():
+            for video, reference, clip in zip(videos, reference_clips(sources[name], clips, fps, resolution), clips):
+                if video.shape != reference.shape or not np.array_equal(video, reference):
+                    failures.append(f'{name} clip {clip} at {resolution}px {fps}fps')
+        print(f'checked {name}: {len(clips)} clips x {len(variants)} variants')
+    return failures
+
+
+def rates(seconds, frames=None, nbytes=None, **extra):
+    row = dict(seconds=round(seconds, 4), **extra)
+    if frames is not None:
+        row['frames'] = frames
+        row['frames_per_s'] = round(frames / seconds, 1) if seconds else None
+    if nbytes is not None:
+        row['mb_per_s'] = round(nbytes / MB / seconds, 1) if seconds else None
+    return row
+
+
+def best_of(fn):
+    # runs fn args.repeat times and keeps its fastest row
+    return min((fn() for _ in range(args.repeat)), key=lambda row: row['seconds'])
+
+
+def bench_read(read_fn, name, clips, **kwargs):
+    # frames/s and MB/s are of the decoded clips, peak memory is ffmpeg's
+    with collect_stages() as stages:
+        start = time.perf_counter()
+        videos = [read_fn(name, fps=args.fps[0], resolution=args.resolution[0], offset_W=offset_W, offset_T=offset_T, **kwargs) for offset_W, offset_T in clips]
+        seconds = time.perf_counter() - start
+    decode = stages['decode']
+    return rates(
+        seconds, frames=sum(map(len, videos)), nbytes=sum(video.nbytes for video in videos),
+        frames_decoded=decode['frames_decoded'], peak_rss_kb=decode['peak_rss_kb'],
+    )
+
+
+def bench_encode(encoder, video, fname):
+    # frames/s and MB/s are of the raw frames going into the encoder
+    start = time.perf_counter()
+    encoder.write(fname, video, args.fps[0])
+    return rates(time.perf_counter() - start, frames=len(video), nbytes=video.nbytes, bytes_out=os.path.getsize(fname))
+
+
+def bench_motion(video):
+    start = time.perf_counter()
+    motion_stats(video)
+    return rates(time.perf_counter() - start, frames=len(video), nbytes=video.nbytes)
+
+
+def bench_read_back(fname):
+    # how fast a downstream reader gets the frames of a written clip back
+    start = time.perf_counter()
+    video = np.load(fname) if fname.suffix == '.npy' else np.stack(imageio.mimread(fname))
+    return rates(time.perf_counter() - start, frames=len(video), nbytes=video.nbytes)
+
+
+def bench_functions(sources, work_dir):
+    rows = {}
+    # the rows are named after the script functions the YouTube-8M and Dreamix reads used to go through
+    for name, starts, offsets_W, *_ in YOUTUBE_DATA:
+        rows[f'read_video[{name}]'] = best_of(partial(bench_read, read_clip, sources[name], list(zip(offsets_W, starts))))
+    for url, _type, w_offset, t_offset, *_ in DREAMIX_DATA:
+        name = Path(url).stem
+        rows[f'read_process_video[{name}]'] = best_of(partial(
+            bench_read, read_clip, sources[name], [(w_offset, t_offset)], crop_box=dreamix.CROP_BOXES[_type], retime_fps=30,
+        ))
+    video = read_clip(sources['yt_720p'], fps=args.fps[0], resolution=args.resolution[0])
+    rows['motion_stats'] = best_of(partial(bench_motion, video))
+    for name, config in ENCODER_CONFIGS.items():
+        encoder = ClipEncoder(**config)
+        fname = work_dir / f'encode_{name}{encoder.suffix}'
+        rows[f'encode[{name}]'] = best_of(partial(bench_encode, encoder, video, fname))
+        rows[f'read_back[{name}]'] = best_of(partial(bench_read_back, fname))
+    return rows
+
+
+def build_args(output_folder, **kwargs):
+    # the options of a dataset build, at their command line defaults unless set here
+    parser = argparse.ArgumentParser()
+    add_build_arguments(parser)
+    build_args = parser.parse_args([])
+    vars(build_args).update(
+        output_folder=str(output_folder), resolution=args.resolution, fps=args.fps, workers=args.workers,
+        encoder=args.encoder, **kwargs,
+    )
+    return build_args
+
+
+def build_dataset(module, output_folder, **kwargs):
+    # builds a dataset into an empty output tree and returns its run_report.json
+    data_dirs = output_dirs(output_folder, args.resolution, args.fps)
+    for data_dir in data_dirs.values():
+        shutil.rmtree(data_dir, ignore_errors=True)
+    module.build(build_args(output_folder, **kwargs))
+    with (next(iter(data_dirs.values())) / 'run_report.json').open() as f:
+        return json.load(f)
+
+
+def pipeline_rows(dataset, report):
+    # Every clip of an uncached build is encoded once per variant, so the encoder takes in
+    # the raw frames the decoder kept. Other stages are rated by the bytes they wrote.
+    stages = report['stages']
+    decode = stages.get('decode', {})
+    # the peak RSS of the run is left out, it is that of the whole benchmark process
+    rows = {f'{dataset}/wall': rates(report['wall_seconds'], frames=decode.get('frames_kept'))}
+    for name, counters in stages.items():
+        if name == 'decode':
+            row = rates(counters['seconds'], frames=counters['frames_kept'], nbytes=counters['bytes_out'],
+                        frames_decoded=counters['frames_decoded'], peak_rss_kb=counters['peak_rss_kb'])
+        elif name == 'motion':
+            row = rates(counters['seconds'], frames=counters['frames'], nbytes=decode.get('bytes_out'))
+        elif name == 'encode':
+            row = rates(counters['seconds'], frames=decode.get('frames_kept'), nbytes=decode.get('bytes_out'))
+        else:
+            row = rates(counters['seconds'], nbytes=counters.get('bytes_out', counters.get('bytes_in')))
+        rows[f'{dataset}/{name}'] = dict(row, calls=counters['calls'])
+    return rows
+
+
+def bench_pipelines(sources, work_dir):
+    youtube_8m.data = YOUTUBE_DATA
+    youtube_8m.download_video = partial(copy_download, sources)
+    dreamix.data = DREAMIX_DATA
+    dreamix.download_video = partial(copy_download, {url: sources[Path(url).stem] for url, *_ in DREAMIX_DATA})
+    loveu_folder = work_dir / 'loveu-tgve-2023'
+    make_loveu_folder(loveu_folder, sources)
+    builds = {
+        'youtube_8m': partial(build_dataset, youtube_8m, work_dir / 'out' / 'youtube_8m'),
+        'dreamix': partial(build_dataset, dreamix, work_dir / 'out' / 'dreamix'),
+        'loveu': partial(build_dataset, loveu, work_dir / 'out' / 'loveu', loveu_folder=str(loveu_folder)),
+    }
+    rows = {}
+    for dataset in args.datasets:
+        report = min((builds[dataset]() for _ in range(args.repeat)), key=lambda report: report['wall_seconds'])
+        rows.update(pipeline_rows(dataset, report))
+    return rows
+
+
+def environment():
+    ffmpeg_version = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True).stdout.split('\n')[0]
+    return dict(python=platform.python_version(), platform=platform.platform(), cpus=os.cpu_count(), ffmpeg=ffmpeg_version)
+
+
+def cell(value, width, digits=1):
+    return f"{'-':>{width}}" if value is None else f'{value:>{width}.{digits}f}'
+
+
+def print_rows(rows, baseline=None):
+    # speedup is baseline seconds over current seconds, so > 1 is faster
+    header = f"{'':36} {'seconds':>9} {'frames/s':>9} {'MB/s':>8} {'peak MB':>8} {'out MB':>8}"
+    if baseline is not None:
+        header += f" {'base s':>9} {'speedup':>8}"
+    print(header)
+    for name, row in rows.items():
+        peak_mb = row['peak_rss_kb'] / 1024 if row.get('peak_rss_kb') else None
+        out_mb = row['bytes_out'] / MB if 'bytes_out' in row else None
+        line = f"{name:36} {cell(row['seconds'], 9, 3)} {cell(row.get('frames_per_s'), 9)} {cell(row.get('mb_per_s'), 8)} {cell(peak_mb, 8)} {cell(out_mb, 8, 3)}"
+        if baseline is not None:
+            base = baseline['rows'].get(name)
+            speedup = base['seconds'] / row['seconds'] if base and row['seconds'] else None
+            line += f" {cell(base and base['seconds'], 9, 3)} " + (f'{speedup:>7.2f}x' if speedup else f"{'-':>8}")
+        print(line)
+
+
+def main():
+    work_dir = Path(args.work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    sources = make_sources(work_dir / 'sources')
+
+    failures = []
+    if not args.skip_check:
+        failures = check_frames(sources)
+    rows = {}
+    if 'functions' in args.benchmarks:
+        rows.update(bench_functions(sources, work_dir))
+    if 'pipelines' in args.benchmarks:
+        rows.update(bench_pipelines(sources, work_dir))
+
+    settings = dict(resolution=args.resolution, fps=args.fps, workers=args.workers, encoder=args.encoder)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['settings'] != settings:
+            print(f"warning: baseline was run with {baseline['settings']}, this run with {settings}")
+    print_rows(rows, baseline)
+
+    if args.save_baseline:
+        write_json_atomic(args.save_baseline, dict(
+            created=time.strftime('%Y-%m-%dT%H:%M:%S'), environment=environment(), settings=settings, repeat=args.repeat, rows=rows,
+        ))
+    if failures:
+        print('frame check failed for:\n' + '\n'.join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--work_dir", type=str, required=True, help="synthetic sources and scratch outputs, sources are kept between runs")
+    parser.add_argument("--resolution", type=int, nargs="+", default=[256])
+    parser.add_argument("--fps", type=int, nargs="+", default=[4])
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--encoder", type=str, default="imageio", choices=ENCODERS, help="clip writer of the dataset builds")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of every benchmark, the fastest one is kept")
+    parser.add_argument("--benchmarks", type=str, nargs="+", default=["functions", "pipelines"], choices=["functions", "pipelines"])
+    parser.add_argument("--datasets", type=str, nargs="+", default=DATASETS, choices=DATASETS)
+    parser.add_argument("--skip_check", action="store_true", help="skip the frame-exactness check against a full decode")
+    parser.add_argument("--save_baseline", type=str, default=None, help="save the results as a baseline JSON")
+    parser.add_argument("--baseline", type=str, default=None, help="baseline JSON to compare the results with")
+    args = parser.parse_args()
+    main()
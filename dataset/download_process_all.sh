@@ -5,17 +5,8 @@
 # This source code is licensed under the license found in the
 # LICENSE file in the root directory of this source tree.
 
-mkdir -p $1
-
-# Download our YouTube8M dataset
-python dataset/download_process_youtube_8m.py --resolution 256 --fps 4 --output_folder $1/youtube_8m_dataset_r256
-
-# Process LOVU-TGVE
-gdown 1D7ZVm66IwlKhS6UINoDgFiFJp_mLIQ0W -O $1/loveu-tgve-2023.zip
-sleep .5
-unzip $1/loveu-tgve-2023.zip -d $1
-rm $1/loveu-tgve-2023.zip
-python dataset/process_loveu.py --resolution 256 --fps 4 --output_folder $1/loveu_dataset_r256 --loveu_folder $1/loveu-tgve-2023
-
-# Dreamix Dataset
-python dataset/download_process_dreamix_dataset.py --resolution 256 --fps 4 --output_folder $1/dreamix_dataset_r256
+# Downloads and processes YouTube8M, LOVEU-TGVE and Dreamix into $1 in one run, sharing the
+# worker pool, the download/clip cache ($MOCA_CACHE_DIR or $1/cache) and the
+# $1/videoedit_index.sqlite index. Extra options are passed on, see `python -m moca_data -h`.
+DATASET_DIR=$(dirname "$0")
+PYTHONPATH=$DATASET_DIR${PYTHONPATH:+:$PYTHONPATH} python -m moca_data "$@"
@@ -0,0 +1,43 @@
+# Portions Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+# Writes the sprite sheet and poster of every mp4 that index.html shows into a previews/
+# folder next to the mp4. The page shows these in place of the videos and only fetches an
+# mp4 when its preview is clicked, see moca_data.preview for the layout of the previews.
+
+import re
+import argparse
+from pathlib import Path
+
+import imageio
+import numpy as np
+
+from moca_data import PREVIEW_DIR, PREVIEW_FORMATS, PreviewWriter, sprite_indices
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--page", type=str, default="index.html")
+    parser.add_argument("--format", type=str, default="jpg", choices=PREVIEW_FORMATS)
+    parser.add_argument("--scale", type=float, default=0.5, help="size of the previews relative to the videos")
+    parser.add_argument("--max_frames", type=int, default=16, help="frames of the sprite sheets, evenly spaced")
+    parser.add_argument("--quality", type=int, default=60)
+    args = parser.parse_args()
+
+    page = Path(args.page)
+    # the videos of the page, whether embedded or behind a preview
+    videos = sorted(set(re.findall(r'(?:src|data-video)="\./([^"]+\.mp4)"', page.read_text())))
+    for video_name in videos:
+        fname = page.parent / video_name
+        with imageio.get_reader(fname) as reader:
+            fps = reader.get_meta_data()['fps']
+            video = np.stack(list(reader.iter_data()))
+        width = round(video.shape[2] * args.scale)
+        writer = PreviewWriter(args.format, width=width, quality=args.quality, max_frames=args.max_frames)
+        sprite, poster = writer.write(fname.parent / PREVIEW_DIR, fname.stem, video)
+        frames = len(sprite_indices(len(video), args.max_frames))
+        # the frames and duration are the data-frames and data-duration of the preview on the page
+        print(f"{video_name}: {frames} frames over {len(video) / fps:.3g}s, {sprite.stat().st_size // 1024} + {poster.stat().st_size // 1024} KB")
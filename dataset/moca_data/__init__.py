@@ -0,0 +1,28 @@
+# Portions Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+# Building blocks of the VideoEdit dataset builds: one extraction engine (extract), one
+# clip writer (writer) with its previews (preview), the build driver (build) with its
+# cache, downloads and stage instrumentation, and the registry of the YouTube-8M,
+# LOVEU-TGVE and Dreamix sources (datasets). `python -m moca_data <output_dir>` builds all
+# of them.
+
+from .build import (
+    INDEX_FIELDS, BuildManifest, build_from_args, build_params, map_sources, merge_shard_trees, open_pool, output_dirs,
+    run_build, shard_dir, shard_plan, variant_params, verify_build, write_index,
+)
+from .cache import Cache, clips_cached, file_checksum, open_cache, read_cached_clips
+from .datasets import DATASETS
+from .download import RetryableError, download_url, http_session, retry
+from .edit_types import BACKGROUND, MOTION, MULTI_MOTION, MULTI_SPATIAL, OBJECT, STYLE
+from .extract import clip_frame_count, iter_frames, mp4_frame_count, read_clip, read_clips, read_frames, variant_name
+from .motion import MOTION_BINS, MOTION_BLOCK, MOTION_FIELDS, motion_stats
+from .preview import PREVIEW_DIR, PREVIEW_FORMATS, PreviewWriter, open_previews, sprite_indices
+from .stages import collect_stages, merge_stages, stage_limit, stage_summary, timed_stage
+from .writer import (
+    ENCODERS, FAN_OUT_MODES, PACK_DIR, PACK_FNAME, PACK_INDEX_FNAME, ClipEncoder, SourceWriter, array_checksum,
+    link_clip, open_encoder, packed_fname, save_clip, save_packed, write_captions, write_json_atomic,
+)
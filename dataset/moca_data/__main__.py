@@ -0,0 +1,11 @@
+# Portions Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+from .cli import main
+
+
+if __name__ == "__main__":
+    main()
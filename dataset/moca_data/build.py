@@ -0,0 +1,572 @@
+# Portions Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import os
+import csv
+import json
+import time
+import resource
+import sqlite3
+import multiprocessing as mp
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import closing, nullcontext
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+from tqdm import tqdm
+
+from .cache import Cache, file_checksum, open_cache
+from .extract import clip_frame_count, variant_name
+from .motion import MOTION_FIELDS
+from .preview import open_previews
+from .stages import _init_stage_limits, _instrumented, collect_stages, merge_stages, stage_summary, timed_stage
+from .writer import PACK_DIR, PACK_FNAME, PACK_INDEX_FNAME, array_checksum, link_clip, open_encoder, packed_fname, write_json_atomic
+
+
+def output_dirs(output_folder, resolutions, fps_list, num_shards=1, shard_index=None):
+    # A single resolution and fps builds into output_folder itself, several build one
+    # <output_folder>_r<res>_f<fps> tree per combination. A shard of a sharded build gets
+    # its own _shard<i>of<n> copy of each tree.
+    variants = [(resolution, fps) for resolution in resolutions for fps in fps_list]
+    if len(variants) == 1:
+        dirs = {variants[0]: Path(output_folder)}
+    else:
+        dirs = {variant: Path(f'{output_folder}_{variant_name(variant)}') for variant in variants}
+    if num_shards > 1 and shard_index is not None:
+        dirs = {variant: shard_dir(data_dir, shard_index, num_shards) for variant, data_dir in dirs.items()}
+    return dirs
+
+
+def open_pool(workers, download_workers=4):
+    # A process pool with enough processes for `workers` cpu stages to run while
+    # `download_workers` others download, see stage_limit. It can be shared by the
+    # map_sources calls of several builds, e.g. of all datasets in one run.
+    limits = {'network': mp.Semaphore(download_workers), 'cpu': mp.Semaphore(workers)}
+    return ProcessPoolExecutor(workers + download_workers, initializer=_init_stage_limits, initargs=(limits,))
+
+
+def map_sources(fn, items, workers=1, download_workers=4, callback=None, prefetch=None, pool=None):
+    # Runs fn over items either serially or on a process pool and returns the results in
+    # input order, so merged outputs are identical to a serial run. The pool has enough
+    # processes for `workers` cpu stages to run while `download_workers` others download.
+    # prefetch(item), if given, runs ahead of fn on `download_workers` threads of this
+    # process, and fn(item) starts once it is done, so item i+1 downloads while item i is
+    # processed even in a serial run.
+    # callback(index, result) is called in this process as soon as each item finishes.
+    # pool is a shared open_pool, which is left open, otherwise one is opened for this call.
+    downloads = ThreadPoolExecutor(download_workers) if prefetch is not None else None
+    try:
+        fetches = [downloads.submit(prefetch, item) for item in items] if downloads is not None else None
+        if workers <= 1:
+            results = []
+            for idx, item in enumerate(tqdm(items)):
+                if fetches is not None:
+                    fetches[idx].result()
+                results.append(fn(item))
+                if callback is not None:
+                    callback(idx, results[-1])
+            return results
+
+        results = [None] * len(items)
+        with (nullcontext(pool) if pool is not None else open_pool(workers, download_workers)) as pool, \
+                tqdm(total=len(items)) as progress:
+            if fetches is not None:
+                fetching = {fetch: idx for idx, fetch in enumerate(fetches)}
+                running = {}
+            else:
+                fetching = {}
+                running = {pool.submit(fn, item): idx for idx, item in enumerate(items)}
+            while fetching or running:
+                done, _ = wait([*fetching, *running], return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in fetching:
+                        idx = fetching.pop(future)
+                        future.result()
+                        running[pool.submit(fn, items[idx])] = idx
+                    else:
+                        idx = running.pop(future)
+                        results[idx] = future.result()
+                        progress.update()
+                        if callback is not None:
+                            callback(idx, results[idx])
+        return results
+    finally:
+        if downloads is not None:
+            downloads.shutdown(cancel_futures=True)
+
+
+class BuildManifest:
+    # Record of what every source in an output directory was built from (its parameters
+    # and input fingerprint) and of the size and checksum of every file it produced,
+    # together with its edit_type_map/clip_map entries. A source whose record matches and
+    # whose outputs are intact is up to date and skipped on the next run.
+
+    def __init__(self, data_dir):
+        self.data_dir = Path(data_dir)
+        self.fname = self.data_dir / 'build_manifest.json'
+        self.sources = json.loads(self.fname.read_text())['sources'] if self.fname.exists() else {}
+
+    def status(self, source, params, fingerprint):
+        entry = self.sources.get(source)
+        if entry is None:
+            return 'missing'
+        if not self.matches(entry, params, fingerprint):
+            return 'stale'
+        # sources built before the metadata index have no clip_info to index
+        if 'clip_info' not in entry:
+            return 'stale'
+        # and those built before the motion statistics have none to index
+        if any('motion_mad' not in info for info in entry['clip_info'].values()):
+            return 'stale'
+        for name, output in entry['outputs'].items():
+            fname = self.data_dir / name
+            if not fname.exists() or fname.stat().st_size != output['size'] or file_checksum(fname) != output['sha256']:
+                return 'stale'
+        pack = entry.get('pack')
+        if pack is not None:
+            rows = self.pack_rows(pack)
+            if rows is None or array_checksum(rows) != pack['sha256']:
+                return 'stale'
+        return 'up to date'
+
+    @staticmethod
+    def matches(entry, params, fingerprint):
+        # compare serialized, so tuples match lists and NaN captions match themselves
+        return json.dumps(entry['params'], sort_keys=True) == json.dumps(params, sort_keys=True) and entry['input'] == fingerprint
+
+    def pack_rows(self, pack):
+        fname = self.data_dir / PACK_FNAME
+        if not fname.exists():
+            return None
+        clips = np.load(fname, mmap_mode='r')
+        if pack['start'] + pack['rows'] > len(clips):
+            return None
+        return clips[pack['start']:pack['start'] + pack['rows']]
+
+    def record(self, source, params, fingerprint, edit_type_mapping, clip_mapping, pack_mapping=None, clip_info=None):
+        names = {f'{key}.txt' for key in edit_type_mapping} | set(clip_mapping.values())
+        if pack_mapping:
+            names.add(packed_fname(source))
+        # the previews of every clip, shared by its edits
+        names |= {info[key] for info in (clip_info or {}).values() for key in ('sprite', 'poster') if key in info}
+        names = sorted(names)
+        # outputs of the previous build that this one no longer writes, e.g. .mp4 clips
+        # after switching to the raw encoder
+        for name in self.sources.get(source, {}).get('outputs', {}).keys() - set(names):
+            (self.data_dir / name).unlink(missing_ok=True)
+        outputs = {
+            name: {'size': (self.data_dir / name).stat().st_size, 'sha256': file_checksum(self.data_dir / name)}
+            for name in names
+        }
+        # the frame count of every clip, which verify_build checks against the clip's header
+        for clip_id, name in clip_mapping.items():
+            if 'frames' in (clip_info or {}).get(clip_id, {}):
+                outputs[name]['frames'] = clip_info[clip_id]['frames']
+        self.sources[source] = {
+            'params': params, 'input': fingerprint, 'outputs': outputs,
+            'edit_type_map': edit_type_mapping, 'clip_map': clip_mapping, 'pack_map': pack_mapping or {},
+            'clip_info': clip_info or {},
+        }
+
+    def save(self):
+        write_json_atomic(self.fname, {'sources': self.sources})
+
+    def write_pack(self, sources):
+        # Assembles clips.npy, a single (N, T*fps, res, res, 3) uint8 array with every clip
+        # of the directory in source order, and clips_index.csv, which maps each clip ID to
+        # its row, edit type and captions. Sources built in this run are read from their
+        # staged arrays and the others are copied from the previous pack, so a source is
+        # only decoded again when it changes. Staged arrays are removed once packed.
+        fname = self.data_dir / PACK_FNAME
+        index_fname = self.data_dir / PACK_INDEX_FNAME
+        entries = [(source, self.sources[source]) for source in sources if self.sources[source].get('pack_map')]
+        if not entries:
+            fname.unlink(missing_ok=True)
+            index_fname.unlink(missing_ok=True)
+            return
+
+        old = np.load(fname, mmap_mode='r') if fname.exists() else None
+        layout = []
+        total = 0
+        for source, entry in entries:
+            if packed_fname(source) in entry['outputs']:
+                clips = np.load(self.data_dir / packed_fname(source), mmap_mode='r')
+            else:
+                clips = old[entry['pack']['start']:entry['pack']['start'] + entry['pack']['rows']]
+            layout.append((source, entry, clips, total))
+            total += len(clips)
+        unchanged = all(
+            entry.get('pack', {}).get('start') == start and packed_fname(source) not in entry['outputs']
+            for source, entry, _, start in layout
+        )
+        if unchanged and old is not None and len(old) == total and index_fname.exists():
+            return
+
+        tmp = self.data_dir / f'.{PACK_FNAME}.{os.getpid()}.tmp.npy'
+        out = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.uint8, shape=(total, *layout[0][2].shape[1:]))
+        index = []
+        for source, entry, clips, start in layout:
+            out[start:start + len(clips)] = clips
+            entry['pack'] = {'start': start, 'rows': len(clips), 'sha256': array_checksum(clips)}
+            for clip_id, row in entry['pack_map'].items():
+                caption, edit_caption = (self.data_dir / f'{clip_id}.txt').read_text().split('\n', 1)
+                index.append([clip_id, start + row, source, entry['edit_type_map'][clip_id], caption, edit_caption])
+        out.flush()
+        del out, old, layout, clips
+        os.replace(tmp, fname)
+
+        tmp = self.data_dir / f'.{PACK_INDEX_FNAME}.{os.getpid()}.tmp'
+        with tmp.open('w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['clip_id', 'index', 'source', 'edit_type', 'source_caption', 'edit_caption'])
+            writer.writerows(index)
+        os.replace(tmp, index_fname)
+
+        staged = []
+        for source, entry in entries:
+            if entry['outputs'].pop(packed_fname(source), None) is not None:
+                staged.append(self.data_dir / packed_fname(source))
+        self.save()
+        for staged_fname in staged:
+            staged_fname.unlink()
+        if (self.data_dir / PACK_DIR).exists() and not any((self.data_dir / PACK_DIR).iterdir()):
+            (self.data_dir / PACK_DIR).rmdir()
+
+
+def shard_plan(jobs, num_shards):
+    # Assigns every source to a shard, heaviest first (clips x edits) to the shard with the
+    # least work so far. Ties are broken by a stable hash of the source ID, so the plan only
+    # depends on the job list and every node computes the same one.
+    loads = [0] * num_shards
+    plan = {}
+    for source, *_, cost in sorted(jobs, key=lambda job: (-job[4]['clips'] * job[4]['edits'], Cache.key(job[0]))):
+        shard = min(range(num_shards), key=lambda i: (loads[i], i))
+        plan[source] = shard
+        loads[shard] += cost['clips'] * cost['edits']
+    return plan
+
+
+def shard_dir(data_dir, shard_index, num_shards):
+    return Path(f'{data_dir}_shard{shard_index}of{num_shards}')
+
+
+def variant_params(params, variant):
+    # the params a variant of a source is recorded with in its manifest
+    return dict(params, resolution=variant[0], fps=variant[1])
+
+
+def run_build(data_dirs, jobs, fn, workers=1, download_workers=4, dry_run=False, write_clip_map=False, index=None, dataset=None,
+              prefetch=None, num_shards=1, shard_index=None, merge_shards=False, report_sources=False, pool=None):
+    # Builds whatever is missing or stale in the build manifests of the output directories.
+    # data_dirs maps each (resolution, fps) variant to its output directory and jobs is a
+    # list of (source, params, fingerprint, item, cost). fn((item, variants)) builds the
+    # given variants of a source from one decode and returns {variant: (edit_type_mapping,
+    # clip_mapping, pack_mapping, clip_info)}, where pack_mapping maps clip IDs to rows of
+    # the arrays staged with save_packed and is empty unless packing, and clip_info maps clip
+    # IDs to their INDEX_FIELDS. cost holds the source's clips, clip seconds and edits for
+    # the dry run plan. Manifests and mapping files are rewritten atomically after every
+    # source, in job order, so an interrupted build keeps everything it finished. With an
+    # index, the rows of these variants in that SQLite file are replaced after the build.
+    # prefetch((item, variants)) downloads a source ahead of fn and pool is a shared open_pool,
+    # see map_sources.
+    #
+    # With num_shards > 1 only the sources of shard_index (see shard_plan) are built, and
+    # data_dirs are that shard's trees from output_dirs, which are neither packed nor
+    # indexed. merge_shards combines the trees of all shards into data_dirs, exactly as a
+    # single run would have built them.
+    #
+    # Every built tree gets a run_report.json with the wall time and bytes/frames counters of
+    # the download, decode, motion, preview, encode, metadata, pack and index stages summed over sources,
+    # broken down per source with report_sources.
+    if num_shards > 1 and merge_shards:
+        if shard_index is not None:
+            raise ValueError('--merge_shards merges all shards, it takes no --shard_index')
+        if not dry_run:
+            merge_shard_trees(data_dirs, jobs, num_shards)
+    elif num_shards > 1:
+        if shard_index is None or not 0 <= shard_index < num_shards:
+            raise ValueError(f'--shard_index must be in [0, {num_shards}) with --num_shards {num_shards}')
+        plan = shard_plan(jobs, num_shards)
+        jobs = [job for job in jobs if plan[job[0]] == shard_index]
+    started = time.time()
+    manifests = {variant: BuildManifest(data_dir) for variant, data_dir in data_dirs.items()}
+
+    stale = []
+    for source, params, fingerprint, _, _ in jobs:
+        statuses = {
+            variant: manifest.status(source, variant_params(params, variant), fingerprint)
+            for variant, manifest in manifests.items()
+        }
+        stale.append({variant: status for variant, status in statuses.items() if status != 'up to date'})
+    todo = [idx for idx, statuses in enumerate(stale) if statuses]
+
+    if dry_run:
+        total = dict(sources=len(todo), clips=0, frames=0, encodes=0, edits=0)
+        for idx in todo:
+            source, _, _, _, cost = jobs[idx]
+            work = dict(
+                clips=cost['clips'], frames=sum(cost['seconds'] * fps for _, fps in stale[idx]),
+                encodes=cost['clips'] * len(stale[idx]), edits=cost['edits'] * len(stale[idx]),
+            )
+            variants = ", ".join(f"{variant_name(variant)} {status}" for variant, status in stale[idx].items())
+            print(f"{source}  [{variants}]  " + ", ".join(f"{v} {k}" for k, v in work.items()))
+            for k, v in work.items():
+                total[k] += v
+        print(f"{len(todo)}/{len(jobs)} sources to build: " + ", ".join(f"{v} {k}" for k, v in total.items() if k != 'sources'))
+        return
+
+    def write_mappings(variant):
+        manifest = manifests[variant]
+        edit_type_mapping = {}
+        clip_mapping = {}
+        for source, *_ in jobs:
+            if source in manifest.sources:
+                edit_type_mapping.update(manifest.sources[source]['edit_type_map'])
+                clip_mapping.update(manifest.sources[source]['clip_map'])
+        write_json_atomic(manifest.data_dir / 'edit_type_map.json', edit_type_mapping)
+        if write_clip_map:
+            write_json_atomic(manifest.data_dir / 'clip_map.json', clip_mapping)
+        else:
+            # a map left by an earlier --fan_out manifest build points at clips that are gone
+            (manifest.data_dir / 'clip_map.json').unlink(missing_ok=True)
+
+    items = [(jobs[idx][3], list(stale[idx])) for idx in todo]
+    source_stages = {}
+    fetch_stages = {}
+
+    def on_result(idx, result):
+        results, stages = result
+        source, params, fingerprint, _, _ = jobs[todo[idx]]
+        merge_stages(stages, fetch_stages.pop(id(items[idx]), {}))
+        with collect_stages() as manifest_stages, timed_stage('metadata'):
+            for variant, mappings in results.items():
+                manifests[variant].record(source, variant_params(params, variant), fingerprint, *mappings)
+                manifests[variant].save()
+                write_mappings(variant)
+        merge_stages(stages, manifest_stages)
+        source_stages[source] = stages
+
+    def instrumented_prefetch(item):
+        with collect_stages() as stages:
+            prefetch(item)
+        fetch_stages[id(item)] = stages
+
+    map_sources(
+        partial(_instrumented, fn), items, workers=workers, download_workers=download_workers, callback=on_result,
+        prefetch=instrumented_prefetch if prefetch is not None else None, pool=pool,
+    )
+    with collect_stages() as run_stages:
+        for variant, manifest in manifests.items():
+            with timed_stage('metadata'):
+                manifest.sources = {source: manifest.sources[source] for source, *_ in jobs if source in manifest.sources}
+                manifest.save()
+                write_mappings(variant)
+            if num_shards == 1 or merge_shards:
+                with timed_stage('pack'):
+                    manifest.write_pack([source for source, *_ in jobs if source in manifest.sources])
+        if index is not None and (num_shards == 1 or merge_shards):
+            with timed_stage('index'):
+                write_index(index, dataset, manifests, [source for source, *_ in jobs])
+
+    totals = {}
+    for stages in [*source_stages.values(), run_stages]:
+        merge_stages(totals, stages)
+    report = dict(
+        started=time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(started)), wall_seconds=round(time.time() - started, 3),
+        workers=workers, download_workers=download_workers, sources=len(jobs), built=len(todo),
+        peak_rss_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, stages=stage_summary(totals),
+    )
+    if report_sources:
+        report['per_source'] = {source: stage_summary(stages) for source, stages in source_stages.items()}
+    for manifest in manifests.values():
+        write_json_atomic(manifest.data_dir / 'run_report.json', report)
+
+
+def merge_shard_trees(data_dirs, jobs, num_shards):
+    # Links the outputs of every source from the tree of its shard into data_dirs and
+    # records them in data_dirs' manifests. Every source must be up to date in its shard, so
+    # shards built with other parameters or inputs are refused.
+    plan = shard_plan(jobs, num_shards)
+    for variant, data_dir in data_dirs.items():
+        shards = [BuildManifest(shard_dir(data_dir, i, num_shards)) for i in range(num_shards)]
+        manifest = BuildManifest(data_dir)
+        for source, params, fingerprint, _, _ in jobs:
+            shard = shards[plan[source]]
+            status = shard.status(source, variant_params(params, variant), fingerprint)
+            if status != 'up to date':
+                raise ValueError(f'{source} is {status} in {shard.data_dir}, build that shard first')
+            entry = json.loads(json.dumps(shard.sources[source]))
+            for name in entry['outputs']:
+                dst = data_dir / name
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                dst.unlink(missing_ok=True)
+                link_clip(shard.data_dir / name, dst)
+            manifest.sources[source] = entry
+        manifest.save()
+
+
+def _check_output(fname, output, checksums=False):
+    # None when fname matches its manifest record, otherwise what differs. The size and
+    # the frame count in the header are checked first and the file is only read in full
+    # when they do not match, or always with checksums.
+    size = fname.stat().st_size
+    frames = output.get('frames')
+    if not checksums and size == output['size'] and (frames is None or clip_frame_count(fname) == frames):
+        return None
+    if file_checksum(fname) == output['sha256']:
+        return None
+    differs = []
+    if size != output['size']:
+        differs.append(f"{size} bytes, expected {output['size']}")
+    if frames is not None:
+        decoded = clip_frame_count(fname, decode=True)
+        if decoded != frames:
+            differs.append(f"{'undecodable' if decoded is None else f'{decoded} frames'}, expected {frames}")
+    return ', '.join(differs) or 'checksum differs'
+
+
+def verify_build(data_dirs, jobs, checksums=False):
+    # Checks the trees of data_dirs against their build manifests and against jobs, the
+    # sources the dataset lists, without building anything. Prints and returns the problems
+    # as (data_dir, kind, name, detail), where kind is
+    #   missing  a source of jobs that was never built, or an output file that is gone
+    #   stale    a source built from other parameters or inputs than its job, or one that
+    #            is no longer in jobs
+    #   corrupt  an output whose size, frame count or checksum differs from its record
+    # Outputs are checked in parallel, once per file for edits hardlinked to one clip,
+    # see _check_output. With jobs None, when the dataset list is not at hand, only the
+    # outputs of the sources recorded in each manifest are checked.
+    started = time.time()
+    problems = []
+    for variant, data_dir in data_dirs.items():
+        manifest = BuildManifest(data_dir)
+        sources = list(manifest.sources) if jobs is None else [source for source, *_ in jobs]
+        found = []
+        for source, params, fingerprint, _, _ in jobs or []:
+            entry = manifest.sources.get(source)
+            if entry is None:
+                found.append((data_dir, 'missing', source, 'not built'))
+            elif not manifest.matches(entry, variant_params(params, variant), fingerprint):
+                found.append((data_dir, 'stale', source, 'built from other parameters or inputs'))
+        for source in sorted(manifest.sources.keys() - set(sources)):
+            found.append((data_dir, 'stale', source, 'not in the dataset list'))
+
+        files = {}
+        for source in sources:
+            entry = manifest.sources.get(source)
+            if entry is None:
+                continue
+            for name, output in entry['outputs'].items():
+                fname = data_dir / name
+                if not fname.exists():
+                    found.append((data_dir, 'missing', name, f'output of {source}'))
+                    continue
+                stat = fname.stat()
+                files.setdefault((stat.st_dev, stat.st_ino), []).append((name, fname, output))
+            if 'pack' in entry:
+                rows = manifest.pack_rows(entry['pack'])
+                if rows is None:
+                    found.append((data_dir, 'missing', PACK_FNAME, f"rows of {source}"))
+                elif checksums and array_checksum(rows) != entry['pack']['sha256']:
+                    found.append((data_dir, 'corrupt', PACK_FNAME, f"rows of {source}, checksum differs"))
+        with ThreadPoolExecutor() as executor:
+            results = executor.map(lambda links: _check_output(links[0][1], links[0][2], checksums), files.values())
+            for links, differs in zip(files.values(), results):
+                if differs is not None:
+                    found.extend((data_dir, 'corrupt', name, differs) for name, _, _ in links)
+
+        checked = sum(map(len, files.values()))
+        print(f"{data_dir}: {len(sources)} sources, {checked} files: " + (f"{len(found)} problems" if found else "ok"))
+        for _, kind, name, detail in found:
+            print(f"  {kind:8} {name}  {detail}")
+        problems.extend(found)
+    print(f"verified in {time.time() - started:.1f}s")
+    return problems
+
+
+INDEX_FIELDS = ['clip_index', 'edit_index', 'offset_T', 'offset_W', 'source_caption', 'edit_caption']
+
+
+def write_index(index_fname, dataset, manifests, sources):
+    # Replaces the rows of a dataset's built variants in the SQLite index shared by all
+    # datasets, with one row per clip ID and variant. Paths are relative to the index file, pack_index is the
+    # clip's row in clips.npy when the directory is packed. The MOTION_FIELDS of the clip (see
+    # motion_stats) filter and stratify by motion without decoding, e.g.
+    # SELECT path FROM clips WHERE edit_type = 'motion' ORDER BY motion_mad; motion_energy and
+    # motion_hist are JSON lists.
+    index_dir = Path(index_fname).resolve().parent
+    with closing(sqlite3.connect(index_fname)) as db, db:
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS clips (dataset TEXT, resolution INTEGER, fps INTEGER, clip_id TEXT, '
+            'source_id TEXT, clip_index INTEGER, edit_index INTEGER, offset_T REAL, offset_W REAL, '
+            'source_caption TEXT, edit_caption TEXT, edit_type TEXT, path TEXT, pack_path TEXT, pack_index INTEGER, '
+            'PRIMARY KEY (dataset, resolution, fps, clip_id))'
+        )
+        # the motion columns are added to indexes written before them
+        columns = {row[1] for row in db.execute('PRAGMA table_info(clips)')}
+        for column, kind in MOTION_FIELDS.items():
+            if column not in columns:
+                db.execute(f'ALTER TABLE clips ADD COLUMN {column} {kind}')
+        db.execute('CREATE INDEX IF NOT EXISTS clips_edit_type ON clips (edit_type)')
+        db.execute('CREATE INDEX IF NOT EXISTS clips_dataset ON clips (dataset)')
+        db.execute('CREATE INDEX IF NOT EXISTS clips_motion_mad ON clips (motion_mad)')
+        rows = []
+        for (resolution, fps), manifest in manifests.items():
+            db.execute('DELETE FROM clips WHERE dataset = ? AND resolution = ? AND fps = ?', (dataset, resolution, fps))
+            data_dir = os.path.relpath(manifest.data_dir.resolve(), index_dir)
+            for source in sources:
+                entry = manifest.sources.get(source)
+                if entry is None:
+                    continue
+                for clip_id, info in entry['clip_info'].items():
+                    pack_path, pack_index = None, None
+                    if 'pack' in entry and clip_id in entry['pack_map']:
+                        pack_path, pack_index = f'{data_dir}/{PACK_FNAME}', entry['pack']['start'] + entry['pack_map'][clip_id]
+                    rows.append((
+                        dataset, resolution, fps, clip_id, source, *[info[field] for field in INDEX_FIELDS],
+                        entry['edit_type_map'][clip_id], f"{data_dir}/{entry['clip_map'][clip_id]}", pack_path, pack_index,
+                        info['motion_mad'], json.dumps(info['motion_energy']), json.dumps(info['motion_hist']),
+                    ))
+        db.executemany(f'INSERT INTO clips VALUES ({", ".join("?" * 18)})', rows)
+
+
+def build_params(args):
+    # the build params every source of a dataset shares. Options at their default are left
+    # out, so trees built before an option existed stay up to date.
+    params = dict(fan_out=args.fan_out)
+    if args.packed:
+        params['packed'] = True
+    if open_encoder(args).params() is not None:
+        params['encoder'] = open_encoder(args).params()
+    if open_previews(args) is not None:
+        params['previews'] = open_previews(args).params()
+    return params
+
+
+def build_from_args(args, jobs, fn, dataset, prefetch=None, pool=None):
+    # run_build into the trees of args.output_folder with the command line options of the
+    # dataset scripts and the moca_data CLI, then trims the cache. With --verify the trees
+    # are checked with verify_build instead and its problems are returned, jobs may then be
+    # None, see verify_build. With --dry_run only the work plan is printed and nothing is written.
+    data_dirs = output_dirs(args.output_folder, args.resolution, args.fps, args.num_shards, args.shard_index)
+    if args.verify:
+        if jobs is not None and args.num_shards > 1 and args.shard_index is not None:
+            plan = shard_plan(jobs, args.num_shards)
+            jobs = [job for job in jobs if plan[job[0]] == args.shard_index]
+        return verify_build(data_dirs, jobs, checksums=args.verify_checksums)
+    # a dry run only reads the trees, the cache and the index
+    if not args.dry_run:
+        for data_dir in data_dirs.values():
+            data_dir.mkdir(parents=True, exist_ok=True)
+    run_build(
+        data_dirs, jobs, fn, workers=args.workers, download_workers=args.download_workers,
+        dry_run=args.dry_run, write_clip_map=args.fan_out == 'manifest', index=args.index, dataset=dataset,
+        num_shards=args.num_shards, shard_index=args.shard_index, merge_shards=args.merge_shards,
+        report_sources=args.report_sources, prefetch=prefetch, pool=pool,
+    )
+    if args.cache_dir and not args.dry_run:
+        open_cache(args).evict()
@@ -0,0 +1,145 @@
+# Portions Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import os
+import json
+import fcntl
+import hashlib
+from pathlib import Path
+
+import numpy as np
+
+
+def file_checksum(fname, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(fname, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class Cache:
+    # Content-addressed on-disk cache for downloaded sources and decoded clips. Entries are
+    # keyed by a hash of everything that produced them, stored next to a sha256 checksum
+    # that is verified on every hit unless the caller opts out, and evicted least recently used first once the cache
+    # grows past max_bytes. Writes go through a temp file and an atomic rename, so pool
+    # workers can share one cache directory.
+
+    def __init__(self, root, max_bytes=None):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+    def path(self, kind, key, suffix):
+        return self.root / kind / key[:2] / f'{key}{suffix}'
+
+    def tmp_path(self, key, suffix):
+        tmp_dir = self.root / 'tmp'
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        return tmp_dir / f'{key}.{os.getpid()}{suffix}'
+
+    def get(self, kind, key, suffix, verify=True):
+        # verify=False trusts an entry whose checksum was written, for files too large to
+        # hash on every hit. The checksum is only written after the entry is complete.
+        fname = self.path(kind, key, suffix)
+        checksum_fname = fname.with_name(fname.name + '.sha256')
+        if not fname.exists() or not checksum_fname.exists():
+            return None
+        if verify and file_checksum(fname) != checksum_fname.read_text():
+            fname.unlink()
+            checksum_fname.unlink()
+            return None
+        os.utime(fname)  # mark as recently used
+        return fname
+
+    def contains(self, kind, key, suffix):
+        # whether an entry is present, without verifying it or marking it as used
+        fname = self.path(kind, key, suffix)
+        return fname.exists() and fname.with_name(fname.name + '.sha256').exists()
+
+    def put(self, kind, key, suffix, src):
+        # moves src into the cache and returns its cached path
+        fname = self.path(kind, key, suffix)
+        fname.parent.mkdir(parents=True, exist_ok=True)
+        checksum_fname = fname.with_name(fname.name + '.sha256')
+        tmp_checksum = self.tmp_path(key, '.sha256')
+        tmp_checksum.write_text(file_checksum(src))
+        os.replace(src, fname)
+        os.replace(tmp_checksum, checksum_fname)
+        return fname
+
+    def get_or_create(self, kind, key, suffix, create_fn, verify=True):
+        # Returns the cached file, calling create_fn(fname) to produce it on a miss. fname is
+        # the same for every attempt, so an interrupted download can resume from its partial
+        # file, and a lock keeps processes sharing the cache from creating it at the same time.
+        # verify is passed to get.
+        fname = self.get(kind, key, suffix, verify)
+        if fname is not None:
+            return fname
+        tmp = self.root / 'tmp' / f'{key}{suffix}'
+        tmp.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.root / 'tmp' / f'{key}.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            fname = self.get(kind, key, suffix, verify)
+            if fname is None:
+                create_fn(tmp)
+                fname = self.put(kind, key, suffix, tmp)
+        return fname
+
+    def get_or_compute_arrays(self, keys, compute_fn):
+        # keys maps names to cache keys, compute_fn(names) computes the arrays of all names
+        # that are not cached in one go and returns them as a dict
+        arrays = {}
+        for name, key in keys.items():
+            fname = self.get('clips', key, '.npy')
+            if fname is not None:
+                arrays[name] = np.load(fname)
+        missing = [name for name in keys if name not in arrays]
+        if missing:
+            for name, array in compute_fn(missing).items():
+                tmp = self.tmp_path(keys[name], '.npy')
+                np.save(tmp, array)
+                self.put('clips', keys[name], '.npy', tmp)
+                arrays[name] = array
+        return arrays
+
+    def evict(self):
+        if self.max_bytes is None:
+            return
+        entries = []
+        for fname in self.root.glob('*/*/*'):
+            if fname.suffix != '.sha256':
+                stat = fname.stat()
+                entries.append((stat.st_mtime, stat.st_size, fname))
+        total = sum(size for _, size, _ in entries)
+        for _, size, fname in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            fname.unlink()
+            fname.with_name(fname.name + '.sha256').unlink(missing_ok=True)
+            total -= size
+
+
+def open_cache(args):
+    if not args.cache_dir:
+        return None
+    return Cache(args.cache_dir, max_bytes=int(args.cache_size * 2**30) if args.cache_size else None)
+
+
+def read_cached_clips(cache, key_parts, variants, decode_fn):
+    # decode_fn(variants) -> {variant: clips}, only called for variants missing from cache
+    if cache is None:
+        return decode_fn(variants)
+    return cache.get_or_compute_arrays({variant: cache.key(*key_parts, *variant) for variant in variants}, decode_fn)
+
+
+def clips_cached(cache, key_parts, variants):
+    # whether read_cached_clips has every variant in the cache, so decode_fn and the source
+    # it reads are not needed
+    return cache is not None and all(cache.contains('clips', cache.key(*key_parts, *variant), '.npy') for variant in variants)
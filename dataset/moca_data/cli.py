@@ -0,0 +1,96 @@
+# Portions Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import os
+import sys
+import copy
+import argparse
+from contextlib import nullcontext
+from pathlib import Path
+
+from .build import open_pool
+from .datasets import DATASETS
+from .preview import PREVIEW_FORMATS
+from .writer import ENCODERS, FAN_OUT_MODES
+
+
+def add_build_arguments(parser):
+    # options shared by the moca_data CLI and the dataset scripts
+    parser.add_argument("--resolution", type=int, nargs="+", default=[256])
+    parser.add_argument("--fps", type=int, nargs="+", default=[4])
+    parser.add_argument("--fan_out", type=str, default="hardlink", choices=FAN_OUT_MODES)
+    parser.add_argument("--encoder", type=str, default="imageio", choices=ENCODERS,
+                        help="clip writer: imageio's default mp4, ffmpeg with the options below, all-intra lossless mp4, or raw .npy")
+    parser.add_argument("--codec", type=str, default="libx264", help="ffmpeg video encoder of --encoder ffmpeg")
+    parser.add_argument("--crf", type=int, default=18)
+    parser.add_argument("--preset", type=str, default="medium")
+    parser.add_argument("--gop", type=int, default=None, help="keyframe interval of --encoder ffmpeg, 1 for all-intra")
+    parser.add_argument("--encoder_threads", type=int, default=0, help="threads of each ffmpeg encoder, 0 lets ffmpeg decide")
+    parser.add_argument("--previews", type=str, default=None, choices=PREVIEW_FORMATS,
+                        help="also write a sprite sheet of its frames and a poster image of every clip, in this format")
+    parser.add_argument("--preview_width", type=int, default=128, help="frame width of the sprite sheets and posters")
+    parser.add_argument("--preview_quality", type=int, default=80)
+    parser.add_argument("--index", type=str, default=None,
+                        help="SQLite metadata index shared by all datasets, the rows of the datasets built are replaced")
+    parser.add_argument("--packed", action="store_true",
+                        help="also pack every clip into clips.npy, indexed by clips_index.csv")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--download_workers", type=int, default=4)
+    parser.add_argument("--cache_dir", type=str, default=None)
+    parser.add_argument("--cache_size", type=float, default=50, help="cache size limit in GB")
+    parser.add_argument("--num_shards", "--num-shards", type=int, default=1,
+                        help="split the build into this many shards, e.g. one per node")
+    parser.add_argument("--shard_index", "--shard-index", type=int, default=None,
+                        help="shard built by this run, into a <tree>_shard<i>of<n> copy of every output tree")
+    parser.add_argument("--merge_shards", "--merge-shards", action="store_true",
+                        help="merge the trees of all --num_shards shards into the output trees")
+    parser.add_argument("--dry_run", "--dry-run", action="store_true", help="print the work plan and exit")
+    parser.add_argument("--verify", action="store_true",
+                        help="check the output trees against their build manifests and the dataset lists instead of building")
+    parser.add_argument("--verify_checksums", action="store_true",
+                        help="with --verify, also checksum the outputs whose size and frame count match")
+    parser.add_argument("--report_sources", action="store_true", help="break run_report.json down per source")
+
+
+def output_folder(output_dir, dataset, resolutions, fps_list):
+    # <output_dir>/<dataset>_dataset_r<res> for a single resolution and fps, otherwise the
+    # prefix of the <output_dir>/<dataset>_dataset_r<res>_f<fps> trees
+    folder = Path(output_dir) / f'{dataset}_dataset'
+    if len(resolutions) * len(fps_list) == 1:
+        return f'{folder}_r{resolutions[0]}'
+    return str(folder)
+
+
+def main(argv=None):
+    # Builds all datasets into output_dir in this process, one after the other on a
+    # shared worker pool, cache and metadata index. With --verify it exits with status 1
+    # when any tree has problems.
+    parser = argparse.ArgumentParser(prog="python -m moca_data", description="download and build the VideoEdit evaluation dataset")
+    parser.add_argument("output_dir", type=str)
+    parser.add_argument("--datasets", type=str, nargs="+", default=list(DATASETS), choices=list(DATASETS))
+    parser.add_argument("--loveu_folder", type=str, default=None,
+                        help="extracted loveu-tgve-2023 folder or its zip, downloaded into the cache if not given")
+    add_build_arguments(parser)
+    args = parser.parse_args(argv)
+
+    output_dir = Path(args.output_dir)
+    if not args.dry_run and not args.verify:
+        output_dir.mkdir(parents=True, exist_ok=True)
+    # an empty --cache_dir or --index turns them off
+    if args.cache_dir is None:
+        args.cache_dir = os.environ.get('MOCA_CACHE_DIR') or str(output_dir / 'cache')
+    if args.index is None:
+        args.index = str(output_dir / 'videoedit_index.sqlite')
+    args.index = args.index or None
+
+    problems = []
+    with open_pool(args.workers, args.download_workers) if args.workers > 1 and not (args.verify or args.dry_run) else nullcontext() as pool:
+        for dataset in args.datasets:
+            dataset_args = copy.copy(args)
+            dataset_args.output_folder = output_folder(output_dir, dataset, args.resolution, args.fps)
+            problems += DATASETS[dataset].build(dataset_args, pool=pool) or []
+    if problems:
+        sys.exit(1)
@@ -0,0 +1,12 @@
+# Portions Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+from . import dreamix, loveu, youtube_8m
+
+
+# Every dataset module has its DATASET name, its own source list or planner and
+# build(args, pool=None), which builds it into args.output_folder.
+DATASETS = {module.DATASET: module for module in [youtube_8m, loveu, dreamix]}
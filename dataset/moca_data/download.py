@@ -0,0 +1,86 @@
+# Portions Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import os
+import time
+import threading
+from pathlib import Path
+
+import requests
+
+from .stages import timed_stage
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def http_session():
+    # one keep-alive session per process, shared by its download threads
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=32)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+    return _session
+
+
+def retry(fn, retries=4, backoff=1.0, exceptions=(Exception,)):
+    # calls fn until it succeeds, sleeping backoff, 2 * backoff, ... seconds between attempts
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except exceptions as e:
+            if attempt == retries:
+                raise
+            print(f"attempt {attempt + 1} failed ({e}), retrying")
+            time.sleep(backoff * 2 ** attempt)
+
+
+class RetryableError(IOError):
+    pass
+
+
+def download_url(url, fname, chunk_size=1 << 20, timeout=60, retries=4, backoff=1.0):
+    # Downloads url to fname over the shared session. The body goes to fname.part, which is
+    # resumed with a Range request when an attempt fails or a previous run was interrupted,
+    # and is renamed to fname once complete. Connection errors, short reads, 429 and 5xx
+    # responses are retried with exponential backoff, other HTTP errors are raised.
+    fname = Path(fname)
+    part = fname.with_name(fname.name + '.part')
+
+    def attempt():
+        offset = part.stat().st_size if part.exists() else 0
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        with http_session().get(url, headers=headers, stream=True, timeout=timeout) as response:
+            if response.status_code == 416 and response.headers.get('Content-Range') == f'bytes */{offset}':
+                # the previous run stopped between the last byte and the rename
+                os.replace(part, fname)
+                return
+            if response.status_code == 416:
+                part.unlink()
+                raise RetryableError(f'{url}: partial download does not match, restarting')
+            if response.status_code == 429 or response.status_code >= 500:
+                raise RetryableError(f'{url}: HTTP {response.status_code}')
+            response.raise_for_status()
+            if response.status_code != 206:
+                offset = 0  # the server ignored the range and sends everything
+            length = response.headers.get('Content-Length')
+            with part.open('ab' if offset else 'wb') as f:
+                for chunk in response.iter_content(chunk_size):
+                    f.write(chunk)
+        if length is not None and 'Content-Encoding' not in response.headers and part.stat().st_size != offset + int(length):
+            raise RetryableError(f'{url}: connection closed after {part.stat().st_size - offset} of {length} bytes')
+        os.replace(part, fname)
+
+    with timed_stage('download') as counters:
+        retry(attempt, retries, backoff, exceptions=(
+            RetryableError, requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+        ))
+        counters['bytes_out'] = fname.stat().st_size
+    return fname
@@ -0,0 +1,141 @@
+# Portions Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import tempfile
+from functools import partial
+from pathlib import Path
+
+from .build import build_from_args, build_params, output_dirs
+from .cache import clips_cached, open_cache, read_cached_clips
+from .download import download_url
+from .edit_types import BACKGROUND, MOTION, MULTI_MOTION, OBJECT, STYLE
+from .extract import read_clips
+from .stages import stage_limit
+from .preview import open_previews
+from .writer import SourceWriter, open_encoder
+
+
+DATASET = "dreamix"
+
+# (top, left, bottom, right) box of the source frame with the input video, by the type of data
+CROP_BOXES = [(0.27, 0.06, 0.73, 0.48), (0.27, 0.04, 0.73, 0.50)]
+
+
+data = [
+    (
+        "https://dreamix-video-editing.github.io/static/videos/vid2vid_cake.mp4", 1, 0.3, 2, "A knife is cutting a papaya on a red plate", 
+        ["A knife is cutting a cake on a red plate"], [OBJECT],
+    ),
+    (
+        "https://dreamix-video-editing.github.io/static/videos/vid2vid_swans.mp4", 1, 0.0, 1, "A beach with palm trees and water", 
+        ["A beach with palm tree and swans in the water"], [OBJECT],
+    ),
+    (
+        "https://dreamix-video-editing.github.io/static/videos/vid2vid_circle.mp4", 1, 0.3, 0, "A hand writing on a paper", 
+        ["A hand drawing a big circle on a paper", "A robot claw writing on a paper"], 
+        [MULTI_MOTION, OBJECT],
+    ),
+    (
+        "https://dreamix-video-editing.github.io/static/videos/banner_video.mp4", 0, 0.0, 0, "A monkey eating food", 
+        ["A bear dancing and jumping to upbeat music, moving his whole body"], 
+        [MULTI_MOTION],
+    ),
+    (
+        "https://dreamix-video-editing.github.io/static/videos/vid2vid_leaping.mp4", 1,  0.15, 0, "A puppy walking", 
+        ["A puppy leaping", "A puppy walking with a party hat"], 
+        [MOTION, OBJECT],
+    ),
+    (
+        "https://dreamix-video-editing.github.io/static/videos/vid2vid_truck_river.mp4", 1, 0.4, 0, "Walking around an old pickup truck", 
+        ["Zooming out from an old pickup truck", "An old pickup truck carrying wood logs", "An old pickup truck crossing a deep river"],
+        [MOTION, OBJECT, MULTI_MOTION],
+    ),
+    (
+        "https://dreamix-video-editing.github.io/static/videos/vid2vid_saxophone.mp4", 1, 0.22, 0, "A man playing a saxophone", 
+        ["A man playing a saxophone with musical notes flying out"], [STYLE],
+    ),
+    (
+        "https://dreamix-video-editing.github.io/static/videos/vid2vid_skateboard.mp4", 1,  0.15, 0, "A deer walking in a forest", 
+        ["A deer rolling on a skateboard in a forest"], [OBJECT],
+    ),
+    (
+        "https://dreamix-video-editing.github.io/static/videos/vid2vid_fire.mp4", 1, 0.25, 0, "Walking through a field on a wooden path", 
+        ["Walking through a field on a wooden path with fire on all sides"], [BACKGROUND],
+    ),
+    (
+        "https://dreamix-video-editing.github.io/static/videos/vid2vid_noodles.mp4", 1, 0.25, 0, "stirring onions in a pot", 
+        ["stirring noodles in a pot"], [OBJECT],
+    ),
+]
+
+
+def download_video(video_url, fname):
+    with stage_limit('network'):
+        download_url(video_url, fname)
+
+
+def fetch_source(cache, video_url, verify=True):
+    return cache.get_or_create('sources', cache.key('url', video_url), '.mp4', partial(download_video, video_url), verify=verify)
+
+
+def clip_key(item):
+    # the key parts of the decoded clip of a source, see read_cached_clips
+    _, (video_url, _type, w_offset, t_offset, *_) = item
+    return ('dreamix', video_url, [(w_offset, t_offset)], CROP_BOXES[_type], 30)
+
+
+def prefetch_source(args, job):
+    # Downloads a source into the cache ahead of process_video unless its clip is cached for
+    # every variant. The worker checksums the source before decoding it, so it is not
+    # checksummed here as well.
+    item, variants = job
+    cache = open_cache(args)
+    if not clips_cached(cache, clip_key(item), variants):
+        fetch_source(cache, item[1][0], verify=False)
+
+
+def process_video(args, job):
+    item, variants = job
+    i, (video_url, _type, w_offset, t_offset, prompt, prompt_edits, edit_types) = item
+    data_dirs = output_dirs(args.output_folder, args.resolution, args.fps, args.num_shards, args.shard_index)
+
+    clips = [(w_offset, t_offset)]
+
+    cache = open_cache(args)
+    def decode(variants):
+        def read(source_fname):
+            with stage_limit('cpu'):
+                return read_clips(source_fname, clips, variants, crop_box=CROP_BOXES[_type], retime_fps=30)
+        if cache is not None:
+            return read(fetch_source(cache, video_url))
+        # without a cache the source and any .part of its download go with the temp dir
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            source_fname = Path(tmp_dir) / 'source.mp4'
+            download_video(video_url, source_fname)
+            return read(source_fname)
+    videos_all = read_cached_clips(cache, clip_key(item), variants, decode)
+
+    results = {}
+    with stage_limit('cpu'):
+        for (resolution, fps), (video,) in videos_all.items():
+            writer = SourceWriter(data_dirs[(resolution, fps)], open_encoder(args), args.fan_out, args.packed, open_previews(args))
+            edits = [(f"{i:02d}_{j:02d}", prompt_edit, edit_type) for j, (prompt_edit, edit_type) in enumerate(zip(prompt_edits, edit_types))]
+            writer.add_clip(f"{i:02d}", video, fps, prompt, edits, offset_W=w_offset, offset_T=t_offset)
+            results[(resolution, fps)] = writer.finish(f"{i:02d}")
+    return results
+
+
+def build(args, pool=None):
+    params = build_params(args)
+    jobs = []
+    for i, d in enumerate(data):
+        cost = dict(clips=1, seconds=2, edits=len(d[5]))
+        jobs.append((f"{i:02d}", dict(params, item=d), d[0], (i, d), cost))
+    return build_from_args(
+        args, jobs, partial(process_video, args), DATASET, pool=pool,
+        # without a cache there is nowhere to keep a prefetched source, so workers download their own
+        prefetch=partial(prefetch_source, args) if args.cache_dir else None,
+    )
@@ -0,0 +1,12 @@
+# Portions Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+OBJECT = "object"
+STYLE = "style"
+MOTION = "motion"
+BACKGROUND = "background"
+MULTI_SPATIAL = "multi_spatial"
+MULTI_MOTION = "multi_motion"
@@ -0,0 +1,312 @@
+# Portions Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import os
+import re
+import time
+import struct
+import tempfile
+import threading
+from collections import deque
+from contextlib import closing
+
+import ffmpeg
+import numpy as np
+
+from .stages import timed_stage
+
+
+def variant_name(variant):
+    resolution, fps = variant
+    return f'r{resolution}_f{fps}'
+
+
+def _vm_hwm(pid):
+    # peak RSS in KB of a running process, 0 once it has exited. This is read from /proc
+    # because the ru_maxrss of a child also counts the RSS of the python process it was
+    # forked from, which Linux carries over the exec.
+    try:
+        with open(f'/proc/{pid}/status', 'rb') as f:
+            return int(re.search(rb'VmHWM:\s*(\d+)', f.read()).group(1))
+    except (OSError, AttributeError):
+        return 0
+
+
+def _reap(process, peak, timeout=1.0):
+    # Gives ffmpeg up to timeout seconds to exit on its own, which it does right after its
+    # last frame and which keeps the stats it prints on exit, and kills it otherwise.
+    # peak is a one-item list with the peak RSS in KB sampled so far, which keeps being
+    # sampled until ffmpeg exits. ru_maxrss is the fallback when it was never sampled.
+    deadline = time.monotonic() + timeout
+    while True:
+        peak[0] = max(peak[0], _vm_hwm(process.pid))
+        pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+        if pid:
+            break
+        if time.monotonic() > deadline:
+            process.kill()
+            pid, status, rusage = os.wait4(process.pid, 0)
+            break
+        time.sleep(0.005)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    peak[0] = peak[0] or rusage.ru_maxrss
+
+
+def _frames_decoded(stderr):
+    # sums the "N frames decoded" that ffmpeg -loglevel verbose reports for every video input on exit
+    return sum(int(n) for n in re.findall(rb'\(video\): \d+ packets read \(\d+ bytes\); (\d+) frames decoded', stderr))
+
+
+def _drain(process, tail, peak):
+    # ffmpeg -loglevel verbose writes to stderr all along, so its peak RSS is sampled here too
+    for chunk in iter(lambda: process.stderr.read1(1 << 16), b''):
+        tail.append(chunk)
+        peak[0] = max(peak[0], _vm_hwm(process.pid))
+
+
+def iter_frames(process, frame_shape, chunk_frames=16, stats=None):
+    # Streams rawvideo frames from an ffmpeg process started with pipe_stdout/pipe_stderr
+    # in chunks of up to chunk_frames frames. Every chunk is a view into the same
+    # preallocated buffer, so copy whatever has to outlive the next iteration. stderr is
+    # drained on a thread (keeping only its tail) so ffmpeg never blocks on a full pipe,
+    # and ffmpeg is stopped as soon as the consumer stops iterating. stats, if given,
+    # receives ffmpeg's stderr tail and peak RSS.
+    stderr_tail = deque(maxlen=16)
+    peak = [0]
+    drain = threading.Thread(target=_drain, args=(process, stderr_tail, peak), daemon=True)
+    drain.start()
+    buffer = np.empty((chunk_frames, *frame_shape), np.uint8)
+    view = memoryview(buffer).cast('B')
+    frame_size = buffer[0].nbytes
+    try:
+        while True:
+            filled = 0
+            while filled < len(view):
+                n = process.stdout.readinto(view[filled:])
+                if not n:
+                    break
+                filled += n
+            if filled >= frame_size:
+                yield buffer[:filled // frame_size]
+            if filled < len(view):
+                return
+    finally:
+        # with stdout closed, a ffmpeg that still has frames to write fails and exits
+        process.stdout.close()
+        _reap(process, peak)
+        drain.join()
+        process.stderr.close()
+        if stats is not None:
+            stats.update(stderr=b''.join(stderr_tail), peak_rss_kb=peak[0])
+
+
+def read_frames(process, num_frames, frame_shape, skip=0, stats=None):
+    # collects frames [skip, skip + num_frames) of an ffmpeg rawvideo pipe into a single
+    # array and stops ffmpeg once they are in, so memory is bounded by the clip size
+    video = np.empty((num_frames, *frame_shape), np.uint8)
+    seen, count = 0, 0
+    with closing(iter_frames(process, frame_shape, stats=stats)) as chunks:
+        for frames in chunks:
+            start = max(0, skip - seen)
+            seen += len(frames)
+            frames = frames[start:start + num_frames - count]
+            video[count:count + len(frames)] = frames
+            count += len(frames)
+            if count == num_frames:
+                break
+    return video[:count]
+
+
+def read_clips(input_file, clips, variants, T=2, max_gap=10, crop_box=None, retime_fps=None):
+    # Extracts T second clips at every (resolution, fps) variant from a single ffmpeg
+    # process and returns {variant: array of shape (len(clips), T*fps, res, res, 3)}.
+    #
+    # clips is a list of (offset_W, offset_T), where an offset_W of None centre-crops.
+    # Clips that are at most max_gap seconds apart share one seeked decode, far apart ones
+    # get their own seek. Each decode is split into an fps -> scale -> trim/crop pyramid
+    # and the branches of a variant are concatenated into one rawvideo output.
+    # crop_box is an optional (top, left, bottom, right) box as fractions of the source
+    # frame and retime_fps plays every source frame back at that rate before sampling.
+    input_file = str(input_file)
+    order = sorted(range(len(clips)), key=lambda idx: clips[idx][1])
+    groups = []
+    for idx in order:
+        if groups and clips[idx][1] - (clips[groups[-1][-1]][1] + T) <= max_gap:
+            groups[-1].append(idx)
+        else:
+            groups.append([idx])
+
+    fps_list = list(dict.fromkeys(fps for _, fps in variants))
+    segments = {variant: [None] * len(clips) for variant in variants}
+    for group in groups:
+        # seek to a whole second at least one second ahead of the first clip and start the
+        # fps grid there, so the sampled frames line up with a full decode from t=0.
+        # Retimed videos are decoded from the start since seeking uses the source timeline.
+        seek = max(0, int(clips[group[0]][1]) - 1) if retime_fps is None else 0
+        stream = ffmpeg.input(input_file, ss=seek) if seek > 0 else ffmpeg.input(input_file)
+        if retime_fps is not None:
+            stream = stream.setpts(f'N/({retime_fps}*TB)')
+        fps_streams = stream.split() if len(fps_list) > 1 else None
+        for f, fps in enumerate(fps_list):
+            stream = fps_streams[f] if fps_streams is not None else stream
+            if seek > 0:
+                stream = stream.filter('fps', fps=fps, round='up', start_time=0)
+            else:
+                stream = stream.filter('fps', fps=fps, round='up')
+            if crop_box is not None:
+                r_tl, c_tl, r_br, c_br = crop_box
+                stream = stream.filter(
+                    'crop', f"trunc(iw*{c_br})-trunc(iw*{c_tl})", f"trunc(ih*{r_br})-trunc(ih*{r_tl})",
+                    f"trunc(iw*{c_tl})", f"trunc(ih*{r_tl})", exact=1,
+                )
+            resolutions = [resolution for resolution, variant_fps in variants if variant_fps == fps]
+            res_streams = stream.split() if len(resolutions) > 1 else None
+            for r, resolution in enumerate(resolutions):
+                scaled = (res_streams[r] if res_streams is not None else stream).filter(
+                    'scale', w=resolution, h=resolution, force_original_aspect_ratio='increase')
+                clip_streams = scaled.split() if len(group) > 1 else None
+                for c, idx in enumerate(group):
+                    offset_W, offset_T = clips[idx]
+                    skip = int(offset_T * fps) - seek * fps
+                    segment = (
+                        (clip_streams[c] if clip_streams is not None else scaled)
+                        .trim(start_frame=skip, end_frame=skip + T*fps)
+                        .setpts('PTS-STARTPTS')
+                    )
+                    if offset_W is None:
+                        segment = segment.filter('crop', resolution, resolution)
+                    else:
+                        segment = segment.filter('crop', resolution, resolution, f"{offset_W}*iw", 0)
+                    segments[(resolution, fps)][idx] = segment
+
+    def output(variant, fname):
+        resolution, fps = variant
+        stream = ffmpeg.concat(*segments[variant]) if len(clips) > 1 else segments[variant][0]
+        return stream.output(fname, format='rawvideo', pix_fmt='rgb24', vsync='passthrough', vframes=len(clips) * T*fps)
+
+    videos = {}
+    with timed_stage('decode', bytes_in=os.path.getsize(input_file)) as counters:
+        stats = {}
+        if len(variants) == 1:
+            # a single variant is streamed straight from the pipe
+            (resolution, fps), = variants
+            process = output(variants[0], 'pipe:').global_args('-loglevel', 'verbose').run_async(pipe_stdout=True, pipe_stderr=True)
+            videos[variants[0]] = read_frames(process, len(clips) * T*fps, (resolution, resolution, 3), stats=stats)
+        else:
+            # several outputs cannot share stdout, so each goes to its own raw file
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                fnames = {variant: os.path.join(tmp_dir, f'{variant_name(variant)}.rgb') for variant in variants}
+                process = (
+                    ffmpeg.merge_outputs(*[output(variant, fnames[variant]) for variant in variants])
+                    .global_args('-loglevel', 'verbose').run_async(pipe_stderr=True)
+                )
+                stderr, peak = [], [0]
+                _drain(process, stderr, peak)
+                process.stderr.close()
+                _reap(process, peak)
+                stats.update(stderr=b''.join(stderr), peak_rss_kb=peak[0])
+                for resolution, fps in variants:
+                    videos[(resolution, fps)] = np.fromfile(fnames[(resolution, fps)], np.uint8).reshape(-1, resolution, resolution, 3)
+        counters.update(
+            bytes_out=sum(video.nbytes for video in videos.values()), frames_decoded=_frames_decoded(stats['stderr']),
+            frames_kept=sum(len(video) for video in videos.values()), peak_rss_kb=stats['peak_rss_kb'],
+        )
+
+    for (resolution, fps), video in videos.items():
+        assert video.shape == (len(clips) * T*fps, resolution, resolution, 3), video.shape
+        videos[(resolution, fps)] = video.reshape(len(clips), T*fps, resolution, resolution, 3)
+    return videos
+
+
+def read_clip(input_file, fps=4, resolution=256, T=2, offset_W=0, offset_T=0, **kwargs):
+    # single clip read_clips; fps and resolution may also be lists, which returns
+    # {(resolution, fps): clip} for every combination from a single decode
+    if np.ndim(fps) == 0 and np.ndim(resolution) == 0:
+        return read_clips(input_file, [(offset_W, offset_T)], [(resolution, fps)], T=T, **kwargs)[(resolution, fps)][0]
+    variants = [(r, f) for r in np.atleast_1d(resolution).tolist() for f in np.atleast_1d(fps).tolist()]
+    videos = read_clips(input_file, [(offset_W, offset_T)], variants, T=T, **kwargs)
+    return {variant: clips[0] for variant, clips in videos.items()}
+
+
+def _mp4_boxes(buf, start, end):
+    # (type, payload start, payload end) of the ISO BMFF boxes in buf[start:end]
+    while start + 8 <= end:
+        size, kind = struct.unpack_from('>I4s', buf, start)
+        header = 8
+        if size == 1 and start + 16 <= end:
+            size, header = struct.unpack_from('>Q', buf, start + 8)[0], 16
+        elif size == 0:
+            size = end - start
+        if size < header:
+            return
+        yield kind, start + header, min(start + size, end)
+        start += size
+
+
+def _mp4_child(buf, box, kind):
+    if box is None:
+        return None
+    return next(((start, end) for k, start, end in _mp4_boxes(buf, *box) if k == kind), None)
+
+
+def mp4_frame_count(fname):
+    # The sample count of the first video track of an mp4, read from its moov box alone:
+    # only the box headers before it are read, nothing is decoded. None when the file has
+    # no complete moov box or no video track.
+    with open(fname, 'rb') as f:
+        end = os.fstat(f.fileno()).st_size
+        start = 0
+        while start + 8 <= end:
+            f.seek(start)
+            header = f.read(16)
+            size, kind = struct.unpack_from('>I4s', header)
+            header_size = 8
+            if size == 1 and len(header) == 16:
+                size, header_size = struct.unpack_from('>Q', header, 8)[0], 16
+            elif size == 0:
+                size = end - start
+            if size < header_size or start + size > end:
+                return None
+            if kind == b'moov':
+                f.seek(start + header_size)
+                moov = f.read(size - header_size)
+                break
+            start += size
+        else:
+            return None
+    for kind, start, stop in _mp4_boxes(moov, 0, len(moov)):
+        if kind != b'trak':
+            continue
+        mdia = _mp4_child(moov, (start, stop), b'mdia')
+        hdlr = _mp4_child(moov, mdia, b'hdlr')
+        if hdlr is None or moov[hdlr[0] + 8:hdlr[0] + 12] != b'vide':
+            continue
+        stsz = _mp4_child(moov, _mp4_child(moov, _mp4_child(moov, mdia, b'minf'), b'stbl'), b'stsz')
+        if stsz is None or stsz[1] - stsz[0] < 12:
+            return None
+        return struct.unpack_from('>I', moov, stsz[0] + 8)[0]
+    return None
+
+
+def clip_frame_count(fname, decode=False):
+    # Frames of a clip written by a ClipEncoder, from its mp4 or .npy header, or with decode
+    # from decoding (loading) all of it. None when the file cannot be read.
+    fname = str(fname)
+    if fname.endswith('.npy'):
+        try:
+            return len(np.load(fname, mmap_mode=None if decode else 'r'))
+        except (OSError, ValueError):
+            return None
+    if not decode:
+        return mp4_frame_count(fname)
+    try:
+        _, stderr = (
+            ffmpeg.input(fname).output('-', format='null')
+            .global_args('-loglevel', 'verbose').run(capture_stdout=True, capture_stderr=True)
+        )
+    except ffmpeg.Error:
+        return None
+    return _frames_decoded(stderr)
@@ -0,0 +1,180 @@
+# Portions Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import os
+import copy
+import shutil
+import tempfile
+import zipfile
+import subprocess
+from contextlib import contextmanager
+from functools import partial
+from pathlib import Path
+
+import pandas as pd
+
+from .build import build_from_args, build_params, output_dirs
+from .cache import open_cache, read_cached_clips
+from .download import retry
+from .edit_types import BACKGROUND, MULTI_SPATIAL, OBJECT, STYLE
+from .extract import read_clips
+from .stages import stage_limit, timed_stage
+from .preview import open_previews
+from .writer import SourceWriter, open_encoder
+
+
+DATASET = "loveu"
+
+# Google Drive file of the dataset zip
+GDRIVE_ID = "1D7ZVm66IwlKhS6UINoDgFiFJp_mLIQ0W"
+ZIP_NAME = "loveu-tgve-2023.zip"
+CSV_NAME = "LOVEU-TGVE-2023_Dataset.csv"
+
+# sentinel rows of the CSV that start the rows of each video folder
+SECTIONS = {'DAVIS Videos:': 'DAVIS_480p', 'Youtube Videos:': 'youtube_480p', 'Videvo Videos:': 'videvo_480p'}
+EDIT_KEYS = ["Style Change Caption", "Object Change Caption", "Background Change Caption", "Multiple Changes Caption"]
+EDIT_TYPES = [STYLE, OBJECT, BACKGROUND, MULTI_SPATIAL]
+
+NAMES = set([
+    'gold-fish', 'trucks-race', 'varanus-cage', 'squirrel-climb', 'dirt-road-driving', 
+    'audi-snow-trail', 'mallard-duck-flight', 'eiffel-flyover', 'las-vegas-time-lapse', 
+    'warsaw-multimedia-fountain', 'geometric-video-background', 
+    'typewriter-super-slow-motion', 'raindrops', 'lotus', 'earth-full-view', 
+    'setting-sun', 'cat-in-the-sun', 'swans', 'red-roses-sunny-day', 'singapore-airbus-a380-landing', 
+    'fireworks-display', 'seagull-flying', 'aircraft-landing', 'sharks-swimming', 
+    'bird-on-feeder', 'cows-grazing', 'ferris-wheel-timelapse', 'butterfly-feeding-slow-motion', 
+    'ski-lift-time-lapse', 'ship-sailing', 'deer-eating-leaves', 'airplane-and-contrail', 
+    'wind-turbines-at-dusk', 'american-flag-in-wind', 'pouring-beer-from-bottle'
+])
+
+
+def zip_root(zf):
+    # members sit under the folder that holds the CSV
+    return next(name for name in zf.namelist() if name.endswith(CSV_NAME))[:-len(CSV_NAME)]
+
+
+@contextmanager
+def loveu_video(loveu_folder, source):
+    # yields a local path of a source video, which is extracted on its own to a temp file
+    # when loveu_folder is the dataset zip
+    loveu_folder = Path(loveu_folder)
+    if loveu_folder.is_dir():
+        yield loveu_folder / source
+        return
+    with zipfile.ZipFile(loveu_folder) as zf, tempfile.TemporaryDirectory() as tmp_dir:
+        video_path = Path(tmp_dir) / Path(source).name
+        with zf.open(zip_root(zf) + source) as src, video_path.open('wb') as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+        yield video_path
+
+
+def plan_videos(df):
+    # Labels every row with the folder of the last sentinel row above it and keeps the
+    # rows in NAMES. The row right before a sentinel separates sections and is skipped.
+    # Returns a work list of (video name, source, caption, [edit caption for each of EDIT_KEYS]).
+    names = df['Video name']
+    sentinel = names.isin(list(SECTIONS))
+    folder = names.where(sentinel).ffill().map(SECTIONS)
+    keep = names.isin(NAMES) & folder.notna() & ~sentinel & ~sentinel.shift(-1, fill_value=False)
+    rows = df[keep]
+    sources = folder[keep] + '/480p_videos/' + rows['Video name'] + '.mp4'
+    return list(zip(rows['Video name'], sources, rows['Our GT caption'], rows[EDIT_KEYS].values.tolist()))
+
+
+def process_row(args, job):
+    (name, source, caption, edit_captions, fingerprint), variants = job
+    data_dirs = output_dirs(args.output_folder, args.resolution, args.fps, args.num_shards, args.shard_index)
+
+    results = {}
+    cache = open_cache(args)
+    with stage_limit('cpu'):
+        # LOVEU clips are the centre-cropped first T seconds
+        clips = [(None, 0)]
+        def decode(variants):
+            with loveu_video(args.loveu_folder, source) as video_path:
+                return read_clips(video_path, clips, variants)
+        # keyed by the fingerprint, so a changed video in a new zip or folder is decoded again
+        videos_all = read_cached_clips(cache, ('loveu', fingerprint, clips), variants, decode)
+        for (resolution, fps), (video,) in videos_all.items():
+            writer = SourceWriter(data_dirs[(resolution, fps)], open_encoder(args), args.fan_out, args.packed, open_previews(args))
+            edits = [(f"{name}_{j:02}", edit_caption, edit_type) for j, (edit_caption, edit_type) in enumerate(zip(edit_captions, EDIT_TYPES))]
+            writer.add_clip(name, video, fps, caption, edits)
+            results[(resolution, fps)] = writer.finish(name)
+    return results
+
+
+def download_dataset(fname):
+    fname = Path(fname)
+    tmp_fname = fname.with_name(f'{fname.stem}.download{fname.suffix}')
+    with stage_limit('network'), timed_stage('download') as counters:
+        cmd = ['gdown', GDRIVE_ID, '-O', str(tmp_fname)]
+        print(' '.join(cmd))
+        retry(lambda: subprocess.run(cmd, check=True), exceptions=(subprocess.CalledProcessError,))
+        os.replace(tmp_fname, fname)
+        counters['bytes_out'] = fname.stat().st_size
+
+
+def fetch_dataset(args):
+    # downloads the dataset zip into the cache, or next to the output tree without one
+    cache = open_cache(args)
+    if cache is None:
+        fname = Path(args.output_folder).parent / ZIP_NAME
+        if not fname.exists():
+            download_dataset(fname)
+        return fname
+    # the multi-GB zip is checksummed when it is written, not on every build that reuses it
+    return cache.get_or_create('sources', cache.key('gdown', GDRIVE_ID), '.zip', download_dataset, verify=False)
+
+
+def cached_dataset(args):
+    # the dataset zip fetch_dataset would return if it is already there, without downloading
+    # it, None otherwise
+    cache = open_cache(args)
+    if cache is None:
+        fname = Path(args.output_folder).parent / ZIP_NAME
+        return fname if fname.exists() else None
+    return cache.get('sources', cache.key('gdown', GDRIVE_ID), '.zip', verify=False)
+
+
+def build(args, pool=None):
+    if args.loveu_folder is None:
+        args = copy.copy(args)
+        if args.verify or args.dry_run:
+            # verifying and dry runs stay offline and fast: the zip is only opened to read the CSV
+            fname = cached_dataset(args)
+            if fname is None and args.dry_run:
+                print(f"{DATASET}: no {ZIP_NAME} at hand, a dry run does not download it, so there are no "
+                      "sources to plan")
+                return None
+            if fname is None:
+                print(f"{DATASET}: no {ZIP_NAME} at hand, the NAMES/CSV cross-check is skipped and only "
+                      "the sources recorded in the build manifests are verified")
+                return build_from_args(args, None, partial(process_row, args), DATASET)
+            args.loveu_folder = str(fname)
+        else:
+            args.loveu_folder = str(fetch_dataset(args))
+
+    loveu_dir = Path(args.loveu_folder)
+    if loveu_dir.is_dir():
+        df = pd.read_csv(loveu_dir / CSV_NAME)
+        video_size = lambda source: (loveu_dir / source).stat().st_size
+    else:
+        # only the CSV is read here, the selected videos are extracted one at a time by the workers
+        with zipfile.ZipFile(loveu_dir) as zf:
+            root = zip_root(zf)
+            with zf.open(root + CSV_NAME) as f:
+                df = pd.read_csv(f)
+            sizes = {info.filename[len(root):]: info.file_size for info in zf.infolist()}
+        video_size = sizes.__getitem__
+
+    params = build_params(args)
+    jobs = []
+    for item in plan_videos(df):
+        name, source = item[:2]
+        cost = dict(clips=1, seconds=2, edits=len(EDIT_KEYS))
+        fingerprint = f"loveu:{source}:{video_size(source)}"
+        jobs.append((name, dict(params, item=item), fingerprint, (*item, fingerprint), cost))
+    return build_from_args(args, jobs, partial(process_row, args), DATASET, pool=pool)
@@ -0,0 +1,45 @@
+# Portions Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import numpy as np
+
+from .stages import timed_stage
+
+
+# the per-clip statistics SourceWriter adds to every clip's clip_info and write_index
+# stores in the index, with their SQLite column types
+MOTION_FIELDS = {'motion_mad': 'REAL', 'motion_energy': 'TEXT', 'motion_hist': 'TEXT'}
+# block size and bin edges, in luma levels of mean absolute difference, of the block-motion
+# histogram. The bins double in width, from static blocks up to cuts and fast motion.
+MOTION_BLOCK = 16
+MOTION_BINS = np.array([0, 1, 2, 4, 8, 16, 32, 64, 256], dtype=np.float32)
+_LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def motion_stats(video, block=MOTION_BLOCK):
+    # Motion statistics of a (T, H, W, 3) uint8 clip from the absolute luma difference of
+    # consecutive frames:
+    #   motion_mad     the mean absolute frame difference over the clip
+    #   motion_energy  the mean squared frame difference of every frame but the first
+    #   motion_hist    the fraction of block x block tiles (over all frame pairs) whose mean
+    #                  absolute difference falls in each MOTION_BINS bin
+    # A clip of a single frame has no motion.
+    with timed_stage('motion', frames=len(video)):
+        if len(video) < 2:
+            return dict(motion_mad=0.0, motion_energy=[], motion_hist=[1.0] + [0.0] * (len(MOTION_BINS) - 2))
+        luma = video @ _LUMA
+        diff = np.abs(luma[1:] - luma[:-1])
+        energy = np.square(diff).mean(axis=(1, 2))
+        t, h, w = diff.shape
+        h, w = max(h // block, 1), max(w // block, 1)
+        bh, bw = diff.shape[1] // h, diff.shape[2] // w
+        blocks = diff[:, :h * bh, :w * bw].reshape(t, h, bh, w, bw).mean(axis=(2, 4))
+        hist, _ = np.histogram(blocks, bins=MOTION_BINS)
+        return dict(
+            motion_mad=round(float(diff.mean()), 4),
+            motion_energy=[round(float(e), 3) for e in energy],
+            motion_hist=[round(float(n), 4) for n in hist / blocks.size],
+        )
@@ -0,0 +1,72 @@
+# Portions Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import numpy as np
+from PIL import Image
+
+from .stages import timed_stage
+
+
+PREVIEW_FORMATS = ['jpg', 'webp']
+PREVIEW_DIR = 'previews'
+
+
+def sprite_indices(num_frames, max_frames=None):
+    # every frame, or max_frames of them evenly spaced over the clip
+    if max_frames is None or num_frames <= max_frames:
+        return np.arange(num_frames)
+    return np.linspace(0, num_frames - 1, max_frames).round().astype(int)
+
+
+class PreviewWriter:
+    # Writes the previews of a (T, H, W, 3) uint8 clip from the frames in memory:
+    #   <stem>_sprite.<fmt>  the frames scaled to width and tiled left to right in one
+    #                        image, which a page animates by stepping background-position
+    #   <stem>_poster.<fmt>  the first frame at the same size, which is also what a <video>
+    #                        shows first, so swapping in the video does not flicker
+    # max_frames caps the frames of the sprite sheet, which then holds evenly spaced ones.
+
+    def __init__(self, fmt='jpg', width=128, quality=80, max_frames=None):
+        if fmt not in PREVIEW_FORMATS:
+            raise ValueError(f'unknown preview format {fmt}, expected one of {PREVIEW_FORMATS}')
+        self.fmt = fmt
+        self.width = width
+        self.quality = quality
+        self.max_frames = max_frames
+
+    def params(self):
+        return dict(fmt=self.fmt, width=self.width, quality=self.quality, max_frames=self.max_frames)
+
+    def names(self, stem):
+        return f'{stem}_sprite.{self.fmt}', f'{stem}_poster.{self.fmt}'
+
+    def frames(self, video):
+        # the sprite sheet frames, scaled with box filtering, as PIL images
+        _, height, width, _ = video.shape
+        size = (self.width, max(round(height * self.width / width), 1))
+        return [Image.fromarray(frame).resize(size, Image.BOX) for frame in video[sprite_indices(len(video), self.max_frames)]]
+
+    def write(self, out_dir, stem, video):
+        # writes the previews into out_dir and returns their paths
+        with timed_stage('preview') as counters:
+            frames = self.frames(video)
+            width, height = frames[0].size
+            sprite = Image.new('RGB', (width * len(frames), height))
+            for k, frame in enumerate(frames):
+                sprite.paste(frame, (k * width, 0))
+            sprite_fname, poster_fname = [out_dir / name for name in self.names(stem)]
+            out_dir.mkdir(parents=True, exist_ok=True)
+            sprite.save(sprite_fname, quality=self.quality)
+            frames[0].save(poster_fname, quality=self.quality)
+            counters['bytes_out'] = sprite_fname.stat().st_size + poster_fname.stat().st_size
+            return sprite_fname, poster_fname
+
+
+def open_previews(args):
+    # the PreviewWriter of the --previews options, None without previews
+    if args.previews is None:
+        return None
+    return PreviewWriter(args.previews, width=args.preview_width, quality=args.preview_quality)
@@ -0,0 +1,80 @@
+# Portions Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import time
+import threading
+from contextlib import contextmanager
+
+
+_stage_stats = threading.local()
+
+
+def merge_stages(totals, stages):
+    # adds {stage: counters} into totals; peak_* counters keep their maximum, the rest add up
+    for name, counters in stages.items():
+        total = totals.setdefault(name, {})
+        for key, value in counters.items():
+            total[key] = max(total.get(key, 0), value) if key.startswith('peak_') else total.get(key, 0) + value
+
+
+def stage_summary(stages):
+    summary = {}
+    for name, counters in stages.items():
+        summary[name] = {key: round(value, 3) if isinstance(value, float) else value for key, value in counters.items()}
+        if counters.get('frames_kept'):
+            summary[name]['decoded_per_kept'] = round(counters['frames_decoded'] / counters['frames_kept'], 2)
+    return summary
+
+
+@contextmanager
+def collect_stages():
+    # collects the timed_stage records of this thread into the yielded dict
+    stages = {}
+    _stage_stats.current = stages
+    try:
+        yield stages
+    finally:
+        _stage_stats.current = None
+
+
+@contextmanager
+def timed_stage(name, **counters):
+    # Times a stage (download, decode, motion, encode, metadata) and records its wall time and
+    # counters in the collection of this thread, if any. The yielded dict takes counters
+    # that are only known once the stage has run, such as bytes_out.
+    counters = dict(counters)
+    start = time.perf_counter()
+    try:
+        yield counters
+    finally:
+        stages = getattr(_stage_stats, 'current', None)
+        if stages is not None:
+            merge_stages(stages, {name: dict(calls=1, seconds=time.perf_counter() - start, **counters)})
+
+
+def _instrumented(fn, item):
+    with collect_stages() as stages:
+        result = fn(item)
+    return result, stages
+
+
+_stage_limits = {}
+
+
+def _init_stage_limits(limits):
+    _stage_limits.update(limits)
+
+
+@contextmanager
+def stage_limit(name):
+    # bounds how many pool workers run a 'network' or 'cpu' stage at the same time,
+    # a no-op in serial runs
+    sem = _stage_limits.get(name)
+    if sem is None:
+        yield
+        return
+    with sem:
+        yield
@@ -0,0 +1,213 @@
+# Portions Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import os
+import json
+import shutil
+import hashlib
+import subprocess
+from pathlib import Path
+
+import ffmpeg
+import imageio
+import numpy as np
+
+from .motion import motion_stats
+from .preview import PREVIEW_DIR
+from .stages import timed_stage
+
+
+FAN_OUT_MODES = ['hardlink', 'reflink', 'copy', 'manifest']
+ENCODERS = ['imageio', 'ffmpeg', 'lossless', 'raw']
+
+
+def link_clip(src, dst, mode='hardlink'):
+    # hardlinks and reflinks fall back to a plain copy when the filesystem refuses them
+    if mode == 'hardlink':
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+    elif mode == 'reflink':
+        if subprocess.run(['cp', '--reflink=always', str(src), str(dst)], stderr=subprocess.DEVNULL).returncode == 0:
+            return
+    shutil.copyfile(src, dst)
+
+
+def save_clip(write_fn, fnames, shared_fname, mode='hardlink'):
+    # Encodes a clip once with write_fn(fname) and fans it out to every edit of the clip.
+    # In 'manifest' mode only shared_fname is written and every edit points at it,
+    # otherwise the clip is encoded to fnames[0] and linked or copied to the rest.
+    # Returns the file each edit points at.
+    fnames = [Path(f) for f in fnames]
+    with timed_stage('encode') as counters:
+        if mode == 'manifest':
+            write_fn(Path(shared_fname))
+            counters['bytes_out'] = Path(shared_fname).stat().st_size
+            return [Path(shared_fname)] * len(fnames)
+
+        # remove stale outputs first so a rerun never writes through an old hardlink
+        for fname in fnames:
+            if fname.exists() or fname.is_symlink():
+                fname.unlink()
+        write_fn(fnames[0])
+        counters['bytes_out'] = fnames[0].stat().st_size
+        for fname in fnames[1:]:
+            link_clip(fnames[0], fname, mode)
+        return fnames
+
+
+class ClipEncoder:
+    # Writes (T, H, W, 3) uint8 clips to files named with the encoder's suffix.
+    #   imageio   imageio's default mp4 writer, which the clips have always been written with
+    #   ffmpeg    the frames are piped into ffmpeg as rawvideo and encoded with codec, crf,
+    #             preset, threads (0 lets ffmpeg decide) and gop, the keyframe interval,
+    #             where a gop of 1 makes every frame a keyframe (all-intra)
+    #   lossless  all-intra libx264rgb at qp 0, which decodes back to exactly the frames
+    #             written and seeks to any frame without decoding others
+    #   raw       no encoding, the frames are saved as .npy
+
+    def __init__(self, kind='imageio', codec='libx264', crf=18, preset='medium', threads=0, gop=None):
+        if kind not in ENCODERS:
+            raise ValueError(f'unknown encoder {kind}, expected one of {ENCODERS}')
+        self.kind = kind
+        self.codec = codec
+        self.crf = crf
+        self.preset = preset
+        self.threads = threads
+        self.gop = gop
+
+    @property
+    def suffix(self):
+        return '.npy' if self.kind == 'raw' else '.mp4'
+
+    def params(self):
+        # the settings that change the written clips, None for the default imageio writer
+        if self.kind == 'imageio':
+            return None
+        if self.kind == 'ffmpeg':
+            return dict(kind=self.kind, codec=self.codec, crf=self.crf, preset=self.preset, gop=self.gop)
+        if self.kind == 'lossless':
+            return dict(kind=self.kind, preset=self.preset)
+        return dict(kind=self.kind)
+
+    def write(self, fname, video, fps):
+        fname = str(fname)
+        if self.kind == 'imageio':
+            imageio.mimsave(fname, video, fps=fps)
+            return
+        if self.kind == 'raw':
+            # np.save would append .npy to a name without it
+            with open(fname, 'wb') as f:
+                np.save(f, video)
+            return
+        if self.kind == 'ffmpeg':
+            options = dict(vcodec=self.codec, crf=self.crf, preset=self.preset, pix_fmt='yuv420p')
+            if self.gop is not None:
+                options['g'] = self.gop
+        else:
+            options = dict(vcodec='libx264rgb', qp=0, preset=self.preset, g=1, pix_fmt='rgb24')
+        _, height, width, _ = video.shape
+        (
+            ffmpeg.input('pipe:', format='rawvideo', pix_fmt='rgb24', s=f'{width}x{height}', framerate=fps)
+            .output(fname, threads=self.threads, **options)
+            .overwrite_output()
+            .run(input=np.ascontiguousarray(video).tobytes(), capture_stdout=True, capture_stderr=True)
+        )
+
+
+def open_encoder(args):
+    return ClipEncoder(args.encoder, codec=args.codec, crf=args.crf, preset=args.preset, threads=args.encoder_threads, gop=args.gop)
+
+
+def write_captions(fname, caption, edit_caption):
+    with timed_stage('metadata') as counters:
+        text = f"{caption}\n{edit_caption}"
+        with Path(fname).open('w') as f:
+            f.write(text)
+        counters['bytes_out'] = len(text.encode())
+
+
+def write_json_atomic(fname, obj):
+    fname = Path(fname)
+    tmp = fname.with_name(f'.{fname.name}.{os.getpid()}.tmp')
+    with tmp.open('w') as f:
+        json.dump(obj, f)
+    os.replace(tmp, fname)
+
+
+PACK_DIR = 'packed'
+PACK_FNAME = 'clips.npy'
+PACK_INDEX_FNAME = 'clips_index.csv'
+
+
+def array_checksum(array):
+    return hashlib.sha256(np.ascontiguousarray(array).data).hexdigest()
+
+
+def packed_fname(source):
+    return f'{PACK_DIR}/{source}.npy'
+
+
+def save_packed(data_dir, source, clips):
+    # stages the decoded clips of a source, shape (N, T*fps, res, res, 3), until
+    # BuildManifest.write_pack copies them into the directory's packed store
+    fname = Path(data_dir) / packed_fname(source)
+    fname.parent.mkdir(exist_ok=True)
+    tmp = fname.with_name(f'.{fname.stem}.{os.getpid()}.tmp.npy')
+    np.save(tmp, np.ascontiguousarray(clips, dtype=np.uint8))
+    os.replace(tmp, fname)
+
+
+class SourceWriter:
+    # Writes the clips of one source into one output directory and collects what run_build
+    # expects back for it: (edit_type_mapping, clip_mapping, pack_mapping, clip_info).
+    # Every clip is encoded once with encoder and fanned out to its edits (see save_clip),
+    # every edit gets an <edit_id>.txt with its captions and the clip's motion_stats in its
+    # clip_info and, when packing, the clips of the source are staged with save_packed.
+    # With a PreviewWriter every clip also gets a sprite sheet and poster under previews/,
+    # which the clip_info of its edits points at.
+
+    def __init__(self, data_dir, encoder, fan_out='hardlink', packed=False, previews=None):
+        self.data_dir = Path(data_dir)
+        self.encoder = encoder
+        self.previews = previews
+        self.fan_out = fan_out
+        self.packed = packed
+        self.clips = []
+        self.edit_type_mapping = {}
+        self.clip_mapping = {}
+        self.pack_mapping = {}
+        self.clip_info = {}
+
+    def add_clip(self, clip_id, video, fps, caption, edits, clip_index=0, offset_W=None, offset_T=0):
+        # edits is a list of (edit_id, edit_caption, edit_type) for the clip
+        clip_fnames = save_clip(
+            lambda fname: self.encoder.write(fname, video, fps),
+            [self.data_dir / f'{edit_id}{self.encoder.suffix}' for edit_id, _, _ in edits],
+            self.data_dir / f'{clip_id}{self.encoder.suffix}', mode=self.fan_out,
+        )
+        info = dict(frames=len(video), **motion_stats(video))
+        if self.previews is not None:
+            sprite, poster = self.previews.write(self.data_dir / PREVIEW_DIR, clip_id, video)
+            info.update(sprite=f'{PREVIEW_DIR}/{sprite.name}', poster=f'{PREVIEW_DIR}/{poster.name}')
+        for k, ((edit_id, edit_caption, edit_type), clip_fname) in enumerate(zip(edits, clip_fnames)):
+            self.edit_type_mapping[edit_id] = edit_type
+            self.clip_mapping[edit_id] = clip_fname.name
+            if self.packed:
+                self.pack_mapping[edit_id] = len(self.clips)
+            self.clip_info[edit_id] = dict(
+                clip_index=clip_index, edit_index=k, offset_T=offset_T, offset_W=offset_W,
+                source_caption=caption, edit_caption=edit_caption, **info,
+            )
+            write_captions(self.data_dir / f'{edit_id}.txt', caption, edit_caption)
+        self.clips.append(video)
+
+    def finish(self, source):
+        if self.packed:
+            save_packed(self.data_dir, source, np.stack(self.clips))
+        return self.edit_type_mapping, self.clip_mapping, self.pack_mapping, self.clip_info
@@ -0,0 +1,11 @@
+# Portions Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import sys
+from pathlib import Path
+
+# moca_data and the dataset scripts are imported from dataset/, as the scripts themselves do
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
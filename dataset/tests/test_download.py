@@ -0,0 +1,160 @@
+# Portions Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+# download_url against a local HTTP server that resumes Range requests, cuts bodies short
+# and fails on cue, and youtube_8m.download_video against a yt-dlp stub on PATH.
+
+import os
+import re
+import stat
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from moca_data import download_url
+from moca_data import download as download_module
+from moca_data import youtube_8m
+
+
+BODY = bytes(range(256)) * 1000
+
+
+class Handler(BaseHTTPRequestHandler):
+    # /file           the body, honouring Range
+    # /truncated      the first response announces the whole body but closes after half of it
+    # /flaky          503 on the first request
+    # /missing        404
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get('Range')))
+        calls = sum(path == self.path for path, _ in self.server.requests)
+        if self.path == '/missing' or (self.path == '/flaky' and calls == 1):
+            self.send_error(404 if self.path == '/missing' else 503)
+            return
+        offset = 0
+        match = re.fullmatch(r'bytes=(\d+)-', self.headers.get('Range', ''))
+        if match:
+            offset = int(match.group(1))
+            if offset >= len(BODY):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(BODY)}')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {offset}-{len(BODY) - 1}/{len(BODY)}')
+        else:
+            self.send_response(200)
+        body = BODY[offset:]
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.path == '/truncated' and calls == 1:
+            body = body[:len(body) // 2]
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(download_module.time, 'sleep', lambda seconds: None)
+
+
+def url(server, path):
+    return f'http://127.0.0.1:{server.server_address[1]}{path}'
+
+
+def test_download(server, tmp_path):
+    fname = download_url(url(server, '/file'), tmp_path / 'video.mp4')
+    assert fname.read_bytes() == BODY
+    assert os.listdir(tmp_path) == ['video.mp4']
+
+
+def test_resumes_partial_download(server, tmp_path):
+    (tmp_path / 'video.mp4.part').write_bytes(BODY[:1000])
+    download_url(url(server, '/file'), tmp_path / 'video.mp4')
+    assert server.requests == [('/file', 'bytes=1000-')]
+    assert (tmp_path / 'video.mp4').read_bytes() == BODY
+    assert not (tmp_path / 'video.mp4.part').exists()
+
+
+def test_complete_partial_download_is_renamed(server, tmp_path):
+    # a run stopped between the last byte and the rename gets a 416 for the full length
+    (tmp_path / 'video.mp4.part').write_bytes(BODY)
+    download_url(url(server, '/file'), tmp_path / 'video.mp4')
+    assert (tmp_path / 'video.mp4').read_bytes() == BODY
+    assert not (tmp_path / 'video.mp4.part').exists()
+
+
+def test_truncated_body_is_resumed(server, tmp_path):
+    # the chunks read before the connection closed are kept, a partial chunk is not
+    download_url(url(server, '/truncated'), tmp_path / 'video.mp4', chunk_size=1000)
+    assert server.requests == [('/truncated', None), ('/truncated', f'bytes={len(BODY) // 2}-')]
+    assert (tmp_path / 'video.mp4').read_bytes() == BODY
+
+
+def test_retries_server_errors(server, tmp_path):
+    download_url(url(server, '/flaky'), tmp_path / 'video.mp4')
+    assert [path for path, _ in server.requests] == ['/flaky', '/flaky']
+    assert (tmp_path / 'video.mp4').read_bytes() == BODY
+
+
+def test_client_errors_raise(server, tmp_path):
+    with pytest.raises(requests.HTTPError):
+        download_url(url(server, '/missing'), tmp_path / 'video.mp4')
+    assert len(server.requests) == 1
+    assert not (tmp_path / 'video.mp4').exists()
+
+
+def test_rename_is_atomic(server, tmp_path, monkeypatch):
+    # fname only ever appears complete, renamed from the .part file
+    renames = []
+    replace = os.replace
+    def checked_replace(src, dst):
+        renames.append((os.path.basename(src), os.path.basename(dst), os.path.exists(dst)))
+        replace(src, dst)
+    monkeypatch.setattr(download_module.os, 'replace', checked_replace)
+    download_url(url(server, '/truncated'), tmp_path / 'video.mp4')
+    assert renames == [('video.mp4.part', 'video.mp4', False)]
+
+
+@pytest.fixture
+def yt_dlp(tmp_path, monkeypatch):
+    # a yt-dlp that fails its first run and writes the -o file on later ones
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    stub = bin_dir / 'yt-dlp'
+    stub.write_text(
+        '#!/bin/sh\n'
+        '# yt-dlp -f <format> -o <fname> <url>\n'
+        f'echo "$5" >> {tmp_path}/yt-dlp.calls\n'
+        f'[ "$(wc -l < {tmp_path}/yt-dlp.calls)" -gt 1 ] || exit 1\n'
+        'printf video > "$4"\n'
+    )
+    stub.chmod(stub.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    return tmp_path / 'yt-dlp.calls'
+
+
+def test_download_video_retries_yt_dlp(yt_dlp, tmp_path):
+    save_fname = tmp_path / 'out' / 'abc.mp4'
+    save_fname.parent.mkdir()
+    youtube_8m.download_video('abc', save_fname)
+    assert yt_dlp.read_text().split() == ['https://www.youtube.com/watch?v=abc'] * 2
+    assert save_fname.read_bytes() == b'video'
+    assert os.listdir(save_fname.parent) == ['abc.mp4']
@@ -0,0 +1,68 @@
+# Portions Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+# read_clips seeks ahead of every clip and decodes only what it keeps. These check it
+# against reference_clips, the full decode from t=0 it replaced, frame for frame.
+
+import ffmpeg
+import numpy as np
+import pytest
+
+from benchmark import reference_clips
+from moca_data import read_clips
+
+
+def make_testsrc(fname, rate, seconds, size='320x240'):
+    # x264 defaults, so the clips have B-frames and keyframes far apart like real uploads
+    (
+        ffmpeg.input(f'testsrc=size={size}:rate={rate}', format='lavfi', t=seconds)
+        .output(str(fname), vcodec='libx264', preset='veryfast', pix_fmt='yuv420p')
+        .overwrite_output().run(quiet=True)
+    )
+    return fname
+
+
+@pytest.fixture(scope='module')
+def ntsc_source(tmp_path_factory):
+    return make_testsrc(tmp_path_factory.mktemp('sources') / 'ntsc.mp4', '30000/1001', 8)
+
+
+@pytest.fixture(scope='module')
+def pal_source(tmp_path_factory):
+    return make_testsrc(tmp_path_factory.mktemp('sources') / 'pal.mp4', 25, 6, size='240x320')
+
+
+VARIANTS = [(64, 4), (64, 8), (96, 4)]
+
+
+def assert_matches_reference(source, clips, variants=VARIANTS):
+    videos_all = read_clips(source, clips, variants)
+    assert set(videos_all) == set(variants)
+    for (resolution, fps), videos in videos_all.items():
+        references = reference_clips(source, clips, fps, resolution)
+        assert len(videos) == len(clips)
+        for video, reference, clip in zip(videos, references, clips):
+            assert video.shape == reference.shape == (2 * fps, resolution, resolution, 3), clip
+            assert np.array_equal(video, reference), f'{clip} at {resolution}px {fps}fps'
+
+
+def test_first_clip(ntsc_source):
+    # the LOVEU layout: centre crop of the first T seconds, no seek
+    assert_matches_reference(ntsc_source, [(None, 0)])
+
+
+@pytest.mark.parametrize('offset_T', [1, 3, 5])
+def test_seek_past_first_second(ntsc_source, offset_T):
+    assert_matches_reference(ntsc_source, [(0.2, offset_T)])
+
+
+def test_multi_clip_layout(ntsc_source):
+    # the YouTube-8M layout: several clips of one source, one decode
+    assert_matches_reference(ntsc_source, [(0.3, 0), (0.2, 2), (0.25, 5)])
+
+
+def test_portrait_source(pal_source):
+    assert_matches_reference(pal_source, [(None, 1), (None, 3)])